@@ -0,0 +1,83 @@
+"""JSON API против HTML-страниц тех же лент: время ответа и запросы.
+
+Запуск из корня репозитория: python -m benchmarks.api_vs_html
+
+Данные создаются в отдельной тестовой базе. Кэш перед каждым
+запросом очищается, чтобы мерить работу с БД и рендер, а не попадания
+в кэш страниц.
+"""
+from benchmarks.utils import best_of, setup_django
+
+setup_django()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (CaptureQueriesContext,  # noqa: E402
+                               setup_test_environment)
+from django.urls import reverse  # noqa: E402
+
+from posts.models import Follow, Group, Post, User  # noqa: E402
+
+AUTHORS = 20
+POSTS_PER_AUTHOR = 100
+GROUP = 'bench'
+
+
+def populate():
+    group = Group.objects.create(title='Бенчмарк', slug=GROUP)
+    reader = User.objects.create_user(username='reader')
+    for i in range(AUTHORS):
+        author = User.objects.create_user(username=f'author{i}')
+        Follow.objects.create(user=reader, author=author)
+        for j in range(POSTS_PER_AUTHOR):
+            Post.objects.create(
+                text=f'Пост {j} автора {i} ' * 20, author=author,
+                group=group if j % 2 else None)
+    return reader
+
+
+def pages():
+    feeds = {
+        'index': {},
+        'group_list': {'slug': GROUP},
+        'profile': {'username': 'author0'},
+        'follow_index': {},
+    }
+    for name, kwargs in feeds.items():
+        yield (name, reverse(f'posts:{name}', kwargs=kwargs),
+               reverse(f'posts:api_{name}', kwargs=kwargs))
+    kwargs = {'post_id': Post.objects.values_list('pk', flat=True).first()}
+    yield ('post_detail', reverse('posts:post_detail', kwargs=kwargs),
+           reverse('posts:api_post_detail', kwargs=kwargs))
+
+
+def measure(client, url, params=None):
+    def get():
+        cache.clear()
+        client.get(url, params)
+    with CaptureQueriesContext(connection) as context:
+        get()
+    # Следующие запросы очистят журнал, поэтому считаем сразу.
+    queries = len(context.captured_queries)
+    return best_of(get, 20), queries
+
+
+def main():
+    # Без DEBUG: иначе страницы рисует ещё и debug_toolbar.
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0)
+    client = Client()
+    client.force_login(populate())
+    print(f'{"лента":<14} {"HTML, мс":>9} {"API, мс":>9} '
+          f'{"API text, мс":>13} {"запросы HTML/API":>17}')
+    for name, html_url, api_url in pages():
+        html_ms, html_queries = measure(client, html_url)
+        api_ms, api_queries = measure(client, api_url)
+        sparse_ms, _ = measure(client, api_url, {'fields': 'id,text'})
+        print(f'{name:<14} {html_ms:>9.2f} {api_ms:>9.2f} {sparse_ms:>13.2f} '
+              f'{html_queries:>9}/{api_queries}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Пропускная способность бэкендов кэша: LocMem, FileBased и MmapCache.
+
+Запуск из корня репозитория: python -m benchmarks.cache_backends
+
+Кроме операций в секунду печатается, видит ли второй процесс значение,
+записанное первым, — без этого инвалидация не доходит до других
+воркеров gunicorn.
+"""
+import os
+import tempfile
+
+from benchmarks.utils import best_of, setup_django
+
+setup_django()
+
+from django.core.cache.backends.filebased import FileBasedCache  # noqa: E402
+from django.core.cache.backends.locmem import LocMemCache  # noqa: E402
+
+from core.mmap_cache import MmapCache  # noqa: E402
+
+KEYS = [f'post:card:{i}:0' for i in range(10)]
+# Примерно одна отрисованная карточка поста.
+VALUE = 'x' * 1000
+OPTIONS = {'OPTIONS': {'MAX_ENTRIES': 10000}}
+
+
+def backends(directory):
+    return {
+        'LocMemCache': LocMemCache('bench', OPTIONS),
+        'FileBasedCache': FileBasedCache(
+            os.path.join(directory, 'files'), OPTIONS),
+        'MmapCache': MmapCache(os.path.join(directory, 'mmap'), OPTIONS),
+    }
+
+
+def shared(cache):
+    """Видит ли дочерний процесс запись, сделанную после fork."""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(write)
+        os.read(read, 1)
+        os._exit(0 if cache.get('shared') == 1 else 1)
+    os.close(read)
+    cache.set('shared', 1)
+    os.write(write, b'1')
+    os.close(write)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+
+
+def run(cache):
+    cache.set_many({key: VALUE for key in KEYS})
+    cache.set('version', 0)
+    operations = {
+        'get': lambda: cache.get(KEYS[0]),
+        'set': lambda: cache.set(KEYS[0], VALUE),
+        'get_many(10)': lambda: cache.get_many(KEYS),
+        'incr': lambda: cache.incr('version'),
+    }
+    return {
+        name: 1000 / best_of(operation, 1000)
+        for name, operation in operations.items()
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            name: (run(cache), shared(cache))
+            for name, cache in backends(directory).items()
+        }
+    columns = ['get', 'set', 'get_many(10)', 'incr']
+    print(f'{"операций/с":<16}'
+          + ''.join(f'{column:>14}' for column in columns)
+          + f'{"общий":>8}')
+    for name, (ops, is_shared) in results.items():
+        print(f'{name:<16}'
+              + ''.join(f'{ops[column]:>14,.0f}' for column in columns)
+              + f'{"да" if is_shared else "нет":>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Время рендера навигации по страницам в зависимости от их числа.
+
+Запуск из корня репозитория: python -m benchmarks.paginator_render
+"""
+from benchmarks.utils import best_of, setup_django
+
+setup_django()
+
+from django.core.paginator import Paginator  # noqa: E402
+from django.template import Context, Template  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from posts.models import Post  # noqa: E402
+from posts.paginators import CursorPaginator  # noqa: E402
+
+PER_PAGE = 10
+# Прежний вариант paginator.html: ссылка на каждую страницу.
+FULL_RANGE = Template(
+    '{% for i in page_obj.paginator.page_range %}'
+    '<li class="page-item"><a class="page-link" href="?page={{ i }}">'
+    '{{ i }}</a></li>{% endfor %}'
+)
+
+
+def windowed_page(total_pages):
+    paginator = CursorPaginator(
+        Post.objects.none(), PER_PAGE, count=total_pages * PER_PAGE)
+    posts = [Post(pk=i, pub_date=timezone.now()) for i in range(PER_PAGE)]
+    return paginator._get_page(posts, 3, paginator)
+
+
+def full_page(total_pages):
+    return Paginator(range(total_pages * PER_PAGE), PER_PAGE).page(3)
+
+
+def main():
+    template = get_template('posts/includes/paginator.html')
+    print(f'{"страниц":>10} {"весь range, мс":>16} {"окно, мс":>10}')
+    for total_pages in (10, 1000, 100000):
+        full = full_page(total_pages)
+        windowed = windowed_page(total_pages)
+        full_ms = best_of(
+            lambda: FULL_RANGE.render(Context({'page_obj': full})), 3)
+        windowed_ms = best_of(
+            lambda: template.render({'page_obj': windowed}), 100)
+        print(f'{total_pages:>10} {full_ms:>16.3f} {windowed_ms:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Пиковая память на одну загрузку большой фотографии.
+
+Запуск из корня репозитория: python -m benchmarks.upload_memory
+
+Каждый вариант работает в отдельном дочернем процессе, чтобы пик RSS
+(ru_maxrss) не накапливался между замерами; из пика вычитается RSS
+процесса перед обработкой.
+"""
+import io
+import os
+import resource
+import tempfile
+
+from benchmarks.utils import setup_django
+
+setup_django()
+
+from django.core.files.uploadedfile import (  # noqa: E402
+    TemporaryUploadedFile)
+from PIL import Image  # noqa: E402
+
+from core.uploads import fit_image  # noqa: E402
+
+# Примерно 40 мегапикселей, как у фото с современного телефона.
+SIZE = (7680, 5120)
+
+
+def current_rss():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def full_decode(upload):
+    """Как было: картинка декодируется целиком и уменьшается потом."""
+    with Image.open(upload) as image:
+        image.load()
+        image.thumbnail((2560, 2560), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG')
+
+
+def draft_decode(upload):
+    fit_image(upload).close()
+
+
+def peak_kb(func, path):
+    """Прирост пика RSS в КБ за время func в дочернем процессе."""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        upload = TemporaryUploadedFile('photo.jpg', 'image/jpeg', 0, None)
+        with open(path, 'rb') as source:
+            upload.write(source.read())
+        upload.seek(0)
+        baseline = current_rss()
+        func(upload)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write, str(peak - baseline).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        result = int(pipe.read() or 0)
+    os.waitpid(pid, 0)
+    return result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'photo.jpg')
+        Image.linear_gradient('L').resize(SIZE).convert('RGB').save(
+            path, 'JPEG', quality=90)
+        print(f'{SIZE[0]}×{SIZE[1]}, {os.path.getsize(path) // 1024} КБ')
+        for name, func in (('полное декодирование', full_decode),
+                           ('fit_image (draft)', draft_decode)):
+            print(f'{name:<24}{peak_kb(func, path) / 1024:>8.1f} МБ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+import timeit
+
+import django
+
+PROJECT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'yatube')
+
+
+def setup_django():
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+
+
+def best_of(func, number, repeat=5):
+    """Лучшее время одного вызова func в миллисекундах."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number * 1000
@@ -0,0 +1,10 @@
+import pytest
+from django.test.utils import override_settings
+
+from core.testing import TEST_SETTINGS
+
+
+@pytest.fixture(autouse=True, scope='session')
+def test_settings(django_test_environment):
+    with override_settings(**TEST_SETTINGS):
+        yield
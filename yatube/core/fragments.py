@@ -0,0 +1,27 @@
+"""Дыры в общей для всех зрителей разметке страницы.
+
+Части страницы, зависящие от пользователя (шапка, кнопка подписки,
+форма комментария), при рендере «оболочки» заменяются комментарием
+с именем шаблона и его аргументами. Перед отдачей ответа fill()
+рендерит эти шаблоны для текущего запроса.
+"""
+import json
+import re
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+PLACEHOLDER = '<!--fragment:{}-->'
+PLACEHOLDER_RE = re.compile(r'<!--fragment:(.*?)-->')
+
+
+def placeholder(template_name, **kwargs):
+    return mark_safe(PLACEHOLDER.format(json.dumps([template_name, kwargs])))
+
+
+def fill(html, request):
+    """Подставляет в разметку фрагменты, отрендеренные для request."""
+    def render(match):
+        template_name, kwargs = json.loads(match.group(1))
+        return render_to_string(template_name, kwargs, request=request)
+    return PLACEHOLDER_RE.sub(render, html)
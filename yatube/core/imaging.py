@@ -0,0 +1,52 @@
+"""Обработка картинок без Django, чтобы её можно было отдать в пул
+процессов.
+"""
+import io
+import time
+
+from PIL import Image, ImageOps, features
+
+WIDTHS = (320, 640, 960, 1920)
+# WebP есть не во всех сборках Pillow; без него остаётся только JPEG.
+FORMATS = ('webp', 'jpeg') if features.check('webp') else ('jpeg',)
+QUALITY = {'webp': 80, 'jpeg': 82}
+
+
+def to_rgb(image):
+    """RGB-копия; прозрачные области заливаются белым."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(data, ratio):
+    """Копии картинки из байтов data с пропорциями ratio (ширина к высоте)
+    для всех ширин из WIDTHS, не больших исходной, во всех FORMATS.
+
+    Ориентация из EXIF применяется к пикселям, а сами метаданные
+    в копии не попадают. Возвращает кортежи (формат, ширина, высота,
+    байты, мс); в мс входит кодирование и доля общего ресайза.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = to_rgb(ImageOps.exif_transpose(image))
+    widths = [width for width in WIDTHS if width <= image.width]
+    variants = []
+    for width in widths or [image.width]:
+        start = time.perf_counter()
+        size = (width, max(round(width / ratio), 1))
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+        resize_ms = (time.perf_counter() - start) * 1000 / len(FORMATS)
+        for image_format in FORMATS:
+            start = time.perf_counter()
+            buffer = io.BytesIO()
+            resized.save(
+                buffer, image_format.upper(),
+                quality=QUALITY[image_format], optimize=True)
+            encode_ms = (time.perf_counter() - start) * 1000
+            variants.append((
+                image_format, *size, buffer.getvalue(),
+                resize_ms + encode_ms))
+    return variants
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """execute_wrapper, который считает запросы и время в БД."""
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'paused', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.queries += 1
+
+
+@contextmanager
+def outside_budget():
+    """Запросы внутри не идут в бюджет текущего запроса. Для работы,
+    которая обычно уходит в фоновый поток, а в тестах и при нуле
+    потоков выполняется прямо в запросе.
+    """
+    paused = getattr(_local, 'paused', False)
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = paused
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы и время в БД на каждый запрос и сверяет их
+    с бюджетом из QUERY_BUDGETS по имени URL (например, posts:index).
+
+    Итог всегда уходит в заголовок X-Query-Budget. Превышение пишется
+    в лог, а при QUERY_BUDGET_STRICT = True лишний запрос поднимает
+    исключение (превышение по времени и тогда только пишется в лог).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = settings.QUERY_BUDGETS.get(
+            view_name, settings.QUERY_BUDGET_DEFAULT)
+        time_ms = counter.time * 1000
+        response['X-Query-Budget'] = (
+            f'queries={counter.queries}/{budget["queries"]}; '
+            f'time={time_ms:.1f}/{budget["time"]}ms')
+        if counter.queries > budget['queries'] or time_ms > budget['time']:
+            message = (
+                f'{view_name or request.path} превысил бюджет запросов: '
+                f'{counter.queries} запросов из {budget["queries"]}, '
+                f'{time_ms:.1f} мс из {budget["time"]}')
+            # Время зависит от загрузки машины, поэтому исключение
+            # только за число запросов, а время всегда лишь в лог.
+            if (settings.QUERY_BUDGET_STRICT
+                    and counter.queries > budget['queries']):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,337 @@
+"""Кэш в отображённом в память файле, общий для всех процессов хоста.
+
+Файл состоит из заголовка, хеш-таблицы записей с открытой адресацией
+и области данных, куда значения дописываются подряд. Когда область
+данных или таблица заполняются, живые записи переупаковываются,
+а при нехватке места вытесняются давно не читанные (LRU). Между
+процессами доступ к файлу разграничивает flock: запись берёт его
+исключительно, чтение — совместно. Потоки одного процесса ходят по
+очереди через обычный Lock.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'YTBCACHE'
+LAYOUT = 1
+HEADER = struct.Struct('<8sIIQQQQ')
+HEADER_SIZE = 64
+# Хеш ключа (0 — пусто, 1 — удалено), смещение и длина записи,
+# срок жизни (0 — бессрочно) и отметка последнего чтения.
+SLOT = struct.Struct('<QQIdQ')
+ACCESS = struct.Struct('<Q')
+ACCESS_OFFSET = SLOT.size - ACCESS.size
+RECORD = struct.Struct('<I')
+EMPTY, DELETED = 0, 1
+DEFAULT_SIZE = 64 * 1024 * 1024
+
+
+def key_hash(key):
+    value = int.from_bytes(
+        hashlib.blake2b(key, digest_size=8).digest(), 'little')
+    return max(value, DELETED + 1)
+
+
+class MmapCache(BaseCache):
+    """Django-бэкенд кэша поверх mmap-файла из LOCATION.
+
+    Файл должен принадлежать пользователю процесса и не быть доступен
+    группе и остальным, иначе кэш не откроется.
+
+    OPTIONS: SIZE — размер области данных в байтах, MAX_ENTRIES
+    и CULL_FREQUENCY — как у LocMemCache. Таблица записей вдвое больше
+    MAX_ENTRIES, чтобы пробирование оставалось коротким.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._data_size = int(
+            params.get('OPTIONS', {}).get('SIZE', DEFAULT_SIZE))
+        self._buckets = self._max_entries * 2
+        self._data_start = HEADER_SIZE + self._buckets * SLOT.size
+        self._thread_lock = threading.Lock()
+        self._pid = None
+
+    # Файл и блокировки.
+
+    def _open(self):
+        os.makedirs(
+            os.path.dirname(self._path) or '.', mode=0o700, exist_ok=True)
+        self._fd = os.open(
+            self._path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        # Значения из файла распаковываются pickle: чужой или доступный
+        # другим файл дал бы выполнить код в каждом процессе.
+        stat = os.fstat(self._fd)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            os.close(self._fd)
+            raise ImproperlyConfigured(
+                f'Файл кэша {self._path} должен принадлежать текущему '
+                'пользователю и быть закрыт для остальных.')
+        size = self._data_start + self._data_size
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            if self._header()[:4] != (
+                    MAGIC, LAYOUT, self._buckets, self._data_size):
+                self._reset()
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _locked(self, shared=False):
+        # После fork дескриптор общий с родителем, и flock между ними
+        # не работает: дочерний процесс открывает файл заново.
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._open()
+        return _Lock(self._thread_lock, self._fd, shared)
+
+    # Заголовок, таблица и данные.
+
+    def _header(self):
+        return HEADER.unpack_from(self._map, 0)
+
+    def _set_header(self, write_offset, count, clock):
+        HEADER.pack_into(
+            self._map, 0, MAGIC, LAYOUT, self._buckets, self._data_size,
+            write_offset, count, clock)
+
+    def _reset(self):
+        self._map[:self._data_start] = bytes(self._data_start)
+        self._set_header(0, 0, 0)
+
+    def _slot(self, index):
+        return SLOT.unpack_from(self._map, HEADER_SIZE + index * SLOT.size)
+
+    def _set_slot(self, index, *slot):
+        SLOT.pack_into(self._map, HEADER_SIZE + index * SLOT.size, *slot)
+
+    def _record(self, offset, length):
+        start = self._data_start + offset
+        (key_length,) = RECORD.unpack_from(self._map, start)
+        key_end = start + RECORD.size + key_length
+        return self._map[start + RECORD.size:key_end], key_end, start + length
+
+    def _find(self, key, hashed):
+        """Номер слота с ключом и номер первого свободного слота."""
+        free = None
+        index = hashed % self._buckets
+        for _ in range(self._buckets):
+            slot_hash, offset, length, _, _ = self._slot(index)
+            if slot_hash == EMPTY:
+                return None, index if free is None else free
+            if slot_hash == DELETED:
+                free = index if free is None else free
+            elif (slot_hash == hashed
+                    and self._record(offset, length)[0] == key):
+                return index, free
+            index = (index + 1) % self._buckets
+        return None, free
+
+    def _fresh(self, key):
+        """Слот ключа, если запись есть и не истекла. Ничего не
+        меняет, так что годится и под совместной блокировкой.
+        """
+        index, _ = self._find(key, key_hash(key))
+        if index is None:
+            return None
+        expires = self._slot(index)[3]
+        if expires and expires <= time.time():
+            return None
+        return index
+
+    def _live(self, key):
+        """Как _fresh, но истёкшая запись сразу удаляется."""
+        index = self._fresh(key)
+        if index is None:
+            index, _ = self._find(key, key_hash(key))
+            if index is not None:
+                self._remove(index)
+            return None
+        return index
+
+    def _read(self, index):
+        _, offset, length, _, access = self._slot(index)
+        _, value_start, value_end = self._record(offset, length)
+        # Часы сдвигает только запись, а чтение помечает запись текущим
+        # значением часов: прочитанное после последней записи считается
+        # равным ей по свежести. LRU от этого приблизительный, зато
+        # читатели меняют лишь своё поле отметки, и то не больше раза
+        # между записями, а одновременно пишут в него одно и то же.
+        clock = self._header()[6]
+        if access < clock:
+            ACCESS.pack_into(
+                self._map, HEADER_SIZE + index * SLOT.size + ACCESS_OFFSET,
+                clock)
+        return pickle.loads(self._map[value_start:value_end])
+
+    def _remove(self, index):
+        self._set_slot(index, DELETED, 0, 0, 0.0, 0)
+        write_offset, count, clock = self._header()[4:]
+        self._set_header(write_offset, count - 1, clock)
+
+    def _write(self, key, value, expires):
+        """Записывает значение; False, если оно не влезает в кэш."""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        record = RECORD.pack(len(key)) + key + data
+        if len(record) > self._data_size // 2:
+            return False
+        index = self._live(key)
+        if index is not None:
+            self._remove(index)
+        write_offset, count, _ = self._header()[4:]
+        if (write_offset + len(record) > self._data_size
+                or count >= self._max_entries):
+            self._compact(len(record))
+        self._append(key, record, expires)
+        return True
+
+    def _append(self, key, record, expires):
+        hashed = key_hash(key)
+        _, free = self._find(key, hashed)
+        write_offset, count, clock = self._header()[4:]
+        start = self._data_start + write_offset
+        self._map[start:start + len(record)] = record
+        self._set_slot(
+            free, hashed, write_offset, len(record), expires, clock + 1)
+        self._set_header(write_offset + len(record), count + 1, clock + 1)
+
+    # Вытеснение.
+
+    def _entries(self):
+        """Живые записи: (отметка чтения, ключ, запись, срок)."""
+        now = time.time()
+        entries = []
+        for index in range(self._buckets):
+            slot_hash, offset, length, expires, access = self._slot(index)
+            if slot_hash <= DELETED or (expires and expires <= now):
+                continue
+            start = self._data_start + offset
+            record = self._map[start:start + length]
+            key = self._record(offset, length)[0]
+            entries.append((access, key, record, expires))
+        return entries
+
+    def _compact(self, needed):
+        """Переупаковывает живые записи, вытесняя самые старые, пока
+        не освободится needed байт и место в таблице.
+        """
+        entries = sorted(self._entries(), reverse=True)
+        used = sum(len(record) for _, _, record, _ in entries)
+        while entries and (
+                used + needed > self._data_size
+                or len(entries) >= self._max_entries):
+            culled = max(len(entries) // self._cull_frequency, 1)
+            for _, _, record, _ in entries[-culled:]:
+                used -= len(record)
+            del entries[-culled:]
+        clock = self._header()[6]
+        self._reset()
+        self._set_header(0, 0, clock)
+        for access, key, record, expires in reversed(entries):
+            self._append(key, record, expires)
+
+    # API BaseCache.
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            if self._live(key) is not None:
+                return False
+            return self._write(key, value, self._expires(timeout))
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        with self._locked(shared=True):
+            for key in keys:
+                index = self._fresh(self._key(key, version))
+                if index is not None:
+                    found[key] = self._read(index)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = []
+        expires = self._expires(timeout)
+        with self._locked():
+            for key, value in data.items():
+                if not self._write(
+                        self._key(key, version), value, expires):
+                    failed.append(key)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            index = self._live(key)
+            if index is None:
+                return False
+            slot = list(self._slot(index))
+            slot[3] = self._expires(timeout)
+            self._set_slot(index, *slot)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            index = self._live(key)
+            if index is None:
+                raise ValueError(f"Key '{key.decode()}' not found")
+            value = self._read(index) + delta
+            self._write(key, value, self._slot(index)[3])
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked(shared=True):
+            return self._fresh(key) is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            index = self._live(key)
+            if index is not None:
+                self._remove(index)
+
+    def clear(self):
+        with self._locked():
+            self._reset()
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout) or 0.0
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key.encode()
+
+
+class _Lock:
+    def __init__(self, thread_lock, fd, shared):
+        self._thread_lock = thread_lock
+        self._fd = fd
+        self._operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        fcntl.flock(self._fd, self._operation)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
@@ -0,0 +1,76 @@
+"""Хранилище, где имя файла — хеш его содержимого.
+
+Одинаковые файлы получают одно имя и лежат на диске один раз, а всё,
+что сделано из файла по имени (миниатюры, копии для srcset), тоже
+готовится однажды. Удалять такой файл можно, только когда на него
+больше никто не ссылается.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_content_name(name):
+    """Назван ли файл по содержимому."""
+    return bool(CONTENT_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который сохраняет файл как
+    <каталог>/<первые два знака хеша>/<sha256><расширение>.
+
+    Каталог берётся из upload_to, расширение — из исходного имени.
+    Если такой файл уже есть, он не перезаписывается.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        try:
+            return super().save(name, content, max_length)
+        except FileExistsError:
+            # Тот же файл уже есть, в том числе если его только что
+            # записал параллельный запрос. Свежее время изменения
+            # защищает файл от уборки, пока новая ссылка на него ещё
+            # не записана в базу.
+            os.utime(self.path(name))
+            return name
+
+    def restore(self, name, content):
+        """Записывает content под готовым именем name, которого нет на
+        диске: например, если файл удалили между save() и записью ссылки.
+        """
+        content.seek(0)
+        try:
+            return self._save(name, content)
+        except FileExistsError:
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя по содержимому не переименовывается: занятое имя значит,
+        # что такой файл уже сохранён. FileSystemStorage._save зовёт
+        # этот метод и при гонке за создание файла.
+        if not is_content_name(name):
+            return super().get_available_name(name, max_length)
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest + extension)
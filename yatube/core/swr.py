@@ -0,0 +1,98 @@
+import math
+import random
+import time
+from collections import Counter
+
+from django.core.cache import cache
+
+LEASE_KEY = 'swr:lease:{}'
+EVENTS = ('hit', 'stale', 'regenerate')
+LEASE_TIMEOUT: int = 10
+STALE_TIMEOUT: int = 60 * 60 * 24
+BETA: float = 1.0
+# Сколько ждать значения, которого в кэше нет вовсе, пока его считает
+# взявший аренду запрос.
+WAIT_TIMEOUT: float = 1.0
+WAIT_STEP: float = 0.05
+
+# Статистика своя у каждого процесса: запись в общий кэш на каждое
+# попадание сделала бы из чтения запись.
+_stats = Counter()
+
+
+def record(name, event):
+    _stats[name, event] += 1
+
+
+def stats(name):
+    """Счётчики попаданий, выдач устаревшей копии и перегенераций
+    в этом процессе.
+    """
+    return {event: _stats[name, event] for event in EVENTS}
+
+
+def expired(expires, delta, now):
+    """Вероятностное раннее истечение (XFetch): чем дольше пересчёт
+    и чем ближе срок, тем вероятнее запрос пересчитает значение заранее.
+    """
+    return now - delta * BETA * math.log(1 - random.random()) >= expires
+
+
+def wait(key, lease_key):
+    """Запись, которую кладёт владелец аренды, или None, если он не
+    успел за WAIT_TIMEOUT.
+    """
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None or not cache.has_key(lease_key):
+            return entry
+    return None
+
+
+def get_or_compute(name, key, compute, timeout, version=None,
+                   fresh=False, on_outdated=None):
+    """Значение из кэша или compute() с защитой от лавины пересчётов.
+
+    Запись хранит значение, версию, срок свежести и время пересчёта.
+    Свежая запись текущей версии отдаётся сразу. Истёкшую запись или
+    запись прошлой версии пересчитывает только взявший аренду запрос,
+    остальные тем временем получают старую копию; для прошлой версии
+    вызывается on_outdated. Если записи нет вовсе, они недолго ждут
+    её от владельца аренды. fresh запрещает отдавать прошлую версию:
+    для автора правки, который должен сразу её увидеть.
+    name — имя для статистики.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, entry_version, expires, delta = entry
+        if entry_version == version and not expired(
+                expires, delta, time.time()):
+            record(name, 'hit')
+            return value
+    lease_key = LEASE_KEY.format(key)
+    leased = cache.add(lease_key, 1, LEASE_TIMEOUT)
+    if not leased:
+        if entry is None:
+            entry = wait(key, lease_key)
+        if entry is not None:
+            value, entry_version = entry[:2]
+            outdated = entry_version != version
+            if not (outdated and fresh):
+                record(name, 'stale')
+                if outdated and on_outdated is not None:
+                    on_outdated()
+                return value
+    try:
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        cache.set(
+            key, (value, version, start + delta + timeout, delta),
+            timeout + STALE_TIMEOUT)
+        record(name, 'regenerate')
+    finally:
+        if leased:
+            cache.delete(lease_key)
+    return value
@@ -0,0 +1,19 @@
+from django import template
+from django.template.loader import render_to_string
+
+from core.fragments import placeholder
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def user_fragment(context, template_name, **kwargs):
+    """Фрагмент, зависящий от пользователя.
+
+    В оболочке страницы для кэша (request.page_shell) выводит дыру,
+    иначе рендерит шаблон сразу, как include.
+    """
+    request = context.get('request')
+    if getattr(request, 'page_shell', False):
+        return placeholder(template_name, **kwargs)
+    return render_to_string(template_name, {**context.flatten(), **kwargs})
@@ -0,0 +1,33 @@
+"""Настройки, которые действуют только в тестах.
+
+manage.py test включает их через TestRunner (TEST_RUNNER в settings),
+pytest — через conftest.py в корне репозитория.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    # Свой кэш у каждого прогона: записи не смешиваются ни с другими
+    # прогонами, ни с запущенным dev-сервером.
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+    # Миниатюры и копии для srcset готовятся сразу, в том же потоке.
+    'THUMBNAIL_WORKERS': 0,
+    'IMAGE_PROCESSES': 0,
+    # Лишний запрос в тестах — ошибка, а не строка в логе.
+    'QUERY_BUDGET_STRICT': True,
+}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
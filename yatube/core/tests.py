@@ -0,0 +1,277 @@
+import fcntl
+import io
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.db import connection
+from PIL import Image
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import imaging, swr
+from core.middleware import (QueryBudgetExceeded, QueryCounter,
+                             outside_budget)
+from core.mmap_cache import MmapCache
+from core.storage import ContentAddressedStorage, is_content_name
+from posts.models import User
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_budget_header(self):
+        """Фактический расход и бюджет попадают в заголовок ответа."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertRegex(
+            response['X-Query-Budget'],
+            r'^queries=\d+/6; time=\d+\.\d/100ms$')
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': {'queries': 0, 'time': 100}},
+        QUERY_BUDGET_STRICT=False)
+    def test_exceeded_budget_is_logged(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', logs.output[0])
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': {'queries': 0, 'time': 100}},
+        QUERY_BUDGET_STRICT=True)
+    def test_exceeded_budget_raises_in_strict_mode(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('posts:index'))
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': {'queries': 30, 'time': 0}})
+    def test_slow_queries_are_only_logged_in_strict_mode(self):
+        with self.assertLogs('core.middleware', 'WARNING'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_tests_run_strict(self):
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+
+    def test_background_work_is_not_counted(self):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            with outside_budget():
+                User.objects.count()
+            User.objects.count()
+        self.assertEqual(counter.queries, 1)
+
+
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        swr._stats.clear()
+        self.compute = mock.Mock(side_effect=['old', 'new'])
+
+    def get(self, version=1, **kwargs):
+        return swr.get_or_compute(
+            'test', 'key', self.compute, 60, version, **kwargs)
+
+    def test_fresh_value_is_computed_once(self):
+        self.assertEqual(self.get(), 'old')
+        self.assertEqual(self.get(), 'old')
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertEqual(
+            swr.stats('test'), {'hit': 1, 'stale': 0, 'regenerate': 1})
+
+    def test_new_version_is_regenerated(self):
+        self.get()
+        self.assertEqual(self.get(version=2), 'new')
+
+    def test_stale_copy_is_served_while_leased(self):
+        """Пока пересчёт истёкшей записи идёт в другом запросе,
+        отдаётся старая копия.
+        """
+        self.get()
+        cache.add(swr.LEASE_KEY.format('key'), 1)
+        with mock.patch('core.swr.expired', return_value=True):
+            self.assertEqual(self.get(), 'old')
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertEqual(swr.stats('test')['stale'], 1)
+
+    def test_previous_version_is_served_while_leased(self):
+        """После смены версии пересчитывает только владелец аренды."""
+        self.get()
+        cache.add(swr.LEASE_KEY.format('key'), 1)
+        on_outdated = mock.Mock()
+        self.assertEqual(self.get(version=2, on_outdated=on_outdated), 'old')
+        self.assertEqual(self.compute.call_count, 1)
+        on_outdated.assert_called_once_with()
+
+    def test_writer_gets_new_version(self):
+        self.get()
+        cache.add(swr.LEASE_KEY.format('key'), 1)
+        self.assertEqual(self.get(version=2, fresh=True), 'new')
+
+    def test_empty_cache_waits_for_lease_holder(self):
+        cache.add(swr.LEASE_KEY.format('key'), 1)
+
+        def finish(seconds):
+            cache.set('key', ('computed', 1, time.time() + 60, 0))
+        with mock.patch('core.swr.time.sleep', side_effect=finish):
+            self.assertEqual(self.get(), 'computed')
+        self.compute.assert_not_called()
+
+    def test_hit_does_not_write_to_cache(self):
+        self.get()
+        with mock.patch.object(cache, 'add') as add, \
+                mock.patch.object(cache, 'incr') as incr:
+            self.get()
+        add.assert_not_called()
+        incr.assert_not_called()
+
+    def test_early_expiration(self):
+        """Долгий пересчёт у самого срока запускается заранее."""
+        with mock.patch('core.swr.random.random', return_value=0.99):
+            self.assertTrue(swr.expired(expires=101, delta=1, now=100))
+            self.assertFalse(swr.expired(expires=110, delta=1, now=100))
+        with mock.patch('core.swr.random.random', return_value=0.0):
+            self.assertFalse(swr.expired(expires=101, delta=1, now=100))
+
+
+class MmapCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        options = {'SIZE': 4096, 'MAX_ENTRIES': 8, **options}
+        return MmapCache(
+            os.path.join(self.directory.name, 'cache'), {'OPTIONS': options})
+
+    def test_get_set_many(self):
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.cache.set('c', {'c': 3})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c', 'd']),
+            {'a': 1, 'b': [2], 'c': {'c': 3}})
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertFalse(self.cache.add('b', 0))
+
+    def test_incr(self):
+        self.cache.set('version', 1)
+        self.assertEqual(self.cache.incr('version'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_shared_between_instances(self):
+        """Второй экземпляр (как другой процесс) видит те же данные."""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.make_cache().get('key'), 'value')
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        children = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                for _ in range(50):
+                    self.cache.incr('counter')
+                os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_ttl(self):
+        self.cache.set('key', 'value', 10)
+        with mock.patch('time.time', return_value=time.time() + 11):
+            self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction(self):
+        for i in range(8):
+            self.cache.set(i, 'x' * 100)
+        self.cache.get(0)
+        for i in range(8, 12):
+            self.cache.set(i, 'x' * 100)
+        self.assertEqual(self.cache.get(0), 'x' * 100)
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.get(11), 'x' * 100)
+
+    def test_reads_take_shared_lock(self):
+        """Чтения разных процессов не ждут друг друга."""
+        self.cache.set('key', 'value')
+        with mock.patch('fcntl.flock') as flock:
+            self.cache.get_many(['key', 'missing'])
+            self.cache.has_key('key')
+        self.assertEqual(
+            {call.args[1] for call in flock.call_args_list},
+            {fcntl.LOCK_SH, fcntl.LOCK_UN})
+
+    def test_file_open_to_others_is_refused(self):
+        path = os.path.join(self.directory.name, 'shared')
+        with open(path, 'wb'):
+            pass
+        os.chmod(path, 0o666)
+        cache = MmapCache(path, {'OPTIONS': {'SIZE': 4096}})
+        with self.assertRaises(ImproperlyConfigured):
+            cache.get('key')
+
+    def test_file_is_private(self):
+        self.cache.set('key', 'value')
+        path = os.path.join(self.directory.name, 'cache')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_data_area_is_compacted(self):
+        """Перезапись ключей не переполняет область данных."""
+        for i in range(200):
+            self.cache.set('key', 'x' * i)
+        self.assertEqual(self.cache.get('key'), 'x' * 199)
+
+
+class ImagingTests(TestCase):
+    def test_variants_are_oriented_and_stripped(self):
+        """Поворот из EXIF применяется, а сами EXIF в копии не попадают."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 400), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        variants = imaging.render_variants(buffer.getvalue(), 2)
+        self.assertEqual(
+            {(width, height) for _, width, height, _, _ in variants},
+            {(320, 160)})
+        for _, _, _, content, processing_ms in variants:
+            with Image.open(io.BytesIO(content)) as image:
+                self.assertFalse(image.getexif())
+            self.assertGreater(processing_ms, 0)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(directory.name)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'photo'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'photo'))
+        other = self.storage.save('posts/a.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(is_content_name(first))
+        self.assertRegex(first, r'^posts/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$')
+        self.assertEqual(
+            len(os.listdir(self.storage.path(os.path.dirname(first)))), 1)
+
+    def test_concurrent_save_keeps_content_name(self):
+        """Проигравший гонку за создание файла получает то же имя."""
+        first = self.storage.save('posts/a.jpg', ContentFile(b'photo'))
+        with mock.patch.object(
+                self.storage, 'exists', side_effect=[False, True]):
+            second = self.storage.save('posts/b.jpg', ContentFile(b'photo'))
+        self.assertEqual(second, first)
+        self.assertEqual(
+            len(os.listdir(self.storage.path(os.path.dirname(first)))), 1)
@@ -0,0 +1,69 @@
+"""Загрузка картинок с ограничением памяти.
+
+Файл больше IMAGE_MAX_BYTES отбрасывается прямо во время приёма,
+картинка больше IMAGE_MAX_PIXELS отклоняется по заголовку, без
+декодирования, а оригинал крупнее IMAGE_MAX_SIDE уменьшается при
+декодировании (draft-режим Pillow для JPEG) и пишется во временный
+файл на диске, а не в память. Большие загрузки и так идут во временные
+файлы: FILE_UPLOAD_MAX_MEMORY_SIZE в настройках невелик.
+"""
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Первый обработчик в цепочке: считает байты каждого файла и
+    бросает файл, как только их больше IMAGE_MAX_BYTES. Имена таких
+    полей попадают в request.oversized_uploads.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if not hasattr(self.request, 'oversized_uploads'):
+            self.request.oversized_uploads = set()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_MAX_BYTES:
+            self.request.oversized_uploads.add(self.field_name)
+            raise SkipFile
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def fit_image(upload):
+    """Проверяет размеры картинки и при необходимости уменьшает её.
+
+    Возвращает upload как есть или новый временный файл с уменьшенной
+    копией. Полностью декодируется только уже уменьшенная картинка.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                f'Картинка {width}×{height} слишком большая: не больше '
+                f'{settings.IMAGE_MAX_PIXELS // 10 ** 6} мегапикселей.')
+        max_side = settings.IMAGE_MAX_SIDE
+        if max(width, height) <= max_side:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        exif = image.info.get('exif')
+        image.draft('RGB', (max_side, max_side))
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        # Безымянный временный файл удаляется сам при закрытии, а
+        # хранилище копирует его кусками.
+        resized = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+        options = {'exif': exif} if exif else {}
+        image.save(resized, image_format, **options)
+    size = resized.tell()
+    resized.seek(0)
+    return UploadedFile(
+        resized, upload.name, upload.content_type, size, upload.charset)
@@ -1,16 +1,81 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
 
+from . import fulltext
 from .models import Comment, Follow, Group, Post
+from .paginators import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*): ни для страниц, ни для «всего»."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    """Фильтр по имени пользователя полем ввода, а не списком всех
+    пользователей.
+    """
+    template = 'admin/username_filter.html'
+
+    def lookups(self, request, model_admin):
+        # Вариантов нет, но без них фильтр не показывается.
+        return ((None, None),)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'hidden': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+
+class FollowerFilter(UsernameFilter):
+    title = 'подписчику'
+    parameter_name = 'user__username'
+
+
+class AuthorFilter(UsernameFilter):
+    title = 'автору'
+    parameter_name = 'author__username'
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу текста, автора и группы вместо icontains.
+        if not search_term:
+            return queryset, False
+        return fulltext.matching(queryset, search_term), False
+
+    def get_changelist_form(self, request, **kwargs):
+        form_class = super().get_changelist_form(request, **kwargs)
+        # Один список групп на всю страницу, а не запрос на каждую строку.
+        group_choices = [
+            choice for choice in form_class.base_fields['group'].choices]
+
+        class ChangelistForm(form_class):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.fields['group'].choices = group_choices
+
+        return ChangelistForm
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -19,14 +84,19 @@ class GroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
+    list_select_related = ('post', 'author')
     search_fields = ('text',)
     list_filter = ('created',)
+    autocomplete_fields = ('post', 'author')
+    # Первичный ключ растёт вместе с created, и для него есть индекс.
+    ordering = ('-pk',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ('pk', 'user', 'author')
-    list_editable = ('user', 'author')
-    list_filter = ('user', 'author')
+    list_select_related = ('user', 'author')
+    list_filter = (FollowerFilter, AuthorFilter)
+    autocomplete_fields = ('user', 'author')
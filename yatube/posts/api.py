@@ -0,0 +1,162 @@
+"""JSON API только для чтения: ленты и пост с комментариями.
+
+Ленты берут те же выборки, что и страницы, но читают из БД только
+колонки запрошенных полей (?fields=text,author) через .values(), так
+что модели на каждый пост не создаются. Листаются курсором
+?before=/?after= без COUNT(*), а ETag и 304 считаются по версиям лент,
+как у страниц.
+"""
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from . import timeline
+from .conditional import (conditional_feed, follow_feeds, group_feeds,
+                          index_feeds, post_feeds, profile_feeds)
+from .models import Group, Post, User
+from .paginators import CursorPaginator, decode_cursor
+from .views import (POSTS_QUANTITY, comments_queryset, group_queryset,
+                    index_queryset, post_queryset, profile_queryset)
+
+# Поле ответа -> колонка Post.
+FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+}
+# Число комментариев меняется без новой версии лент, поэтому оно есть
+# только у отдельного поста.
+POST_FIELDS = {**FIELDS, 'comments_count': 'comments_count'}
+COMMENT_COLUMNS = ('id', 'author__username', 'text', 'created')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def requested_fields(request, available):
+    """Поля из ?fields=a,b в порядке запроса, по умолчанию все."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    fields = list(dict.fromkeys(
+        field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(
+            400, f'Неизвестные поля: {", ".join(unknown)}. '
+                 f'Доступны: {", ".join(available)}.')
+    return fields
+
+
+def serialize(rows, fields, available):
+    image_url = Post._meta.get_field('image').storage.url
+    items = []
+    for row in rows:
+        item = {field: row[available[field]] for field in fields}
+        if 'image' in item:
+            item['image'] = image_url(item['image']) if item['image'] else None
+        items.append(item)
+    return items
+
+
+def link(request, **params):
+    query = request.GET.copy()
+    for name in ('before', 'after', 'page'):
+        query.pop(name, None)
+    query.update(params)
+    return f'{request.path}?{query.urlencode()}'
+
+
+def feed(request, paginator):
+    """Курсорная страница ленты: посты и ссылки на соседние страницы."""
+    fields = requested_fields(request, FIELDS)
+    paginator.only_columns([FIELDS[field] for field in fields])
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if decode_cursor(before or after or '') is None:
+        page = paginator.first_cursor_page()
+    else:
+        page = paginator.get_cursor_page(before=before, after=after)
+    return {
+        'results': serialize(page.object_list, fields, FIELDS),
+        'next': (link(request, before=page.older_cursor)
+                 if page.older_cursor else None),
+        'previous': (link(request, after=page.newer_cursor)
+                     if page.newer_cursor else None),
+    }
+
+
+def api_view(view):
+    """GET и HEAD, ответ view в JSON; ошибки тоже в JSON."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            data = view(request, *args, **kwargs)
+        except Http404:
+            data, status = {'error': 'Не найдено.'}, 404
+        except ApiError as error:
+            data, status = {'error': str(error)}, error.status
+        else:
+            status = 200
+        return JsonResponse(
+            data, status=status, json_dumps_params={'ensure_ascii': False})
+    return wrapper
+
+
+@conditional_feed(index_feeds)
+@api_view
+def index(request):
+    return feed(request, CursorPaginator(index_queryset(), POSTS_QUANTITY))
+
+
+@conditional_feed(group_feeds)
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed(
+        request, CursorPaginator(group_queryset(group), POSTS_QUANTITY))
+
+
+@conditional_feed(profile_feeds)
+@api_view
+def profile(request, username):
+    user_obj = get_object_or_404(User, username=username)
+    return feed(
+        request, CursorPaginator(profile_queryset(user_obj), POSTS_QUANTITY))
+
+
+@conditional_feed(follow_feeds)
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужно войти.')
+    paginator, _ = timeline.feed_paginator(request.user, POSTS_QUANTITY)
+    return feed(request, paginator)
+
+
+@conditional_feed(post_feeds)
+@api_view
+def post_detail(request, post_id):
+    fields = requested_fields(request, POST_FIELDS)
+    columns = {POST_FIELDS[field] for field in fields}
+    post = post_queryset().filter(pk=post_id).values(*columns).first()
+    if post is None:
+        raise Http404
+    comments = [
+        {'id': pk, 'author': author, 'text': text, 'created': created}
+        for pk, author, text, created in comments_queryset(
+            post_id).values_list(*COMMENT_COLUMNS)
+    ]
+    return {
+        'post': serialize([post], fields, POST_FIELDS)[0],
+        'comments': comments,
+    }
@@ -0,0 +1,88 @@
+"""Счётчики ссылок постов на файлы картинок в хранилище по содержимому.
+
+Картинки со старыми именами (до хранилища по содержимому) в учёт
+не попадают и не удаляются.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from core.storage import is_content_name
+
+from . import thumbnails
+from .models import ImageBlob, ImageVariant, Post
+
+
+def storage():
+    return Post._meta.get_field('image').storage
+
+
+def acquire(name, content=None):
+    """Ещё одна ссылка на файл name; строка заводится при первой.
+
+    Хранилище отдаёт имя уже лежащего файла, не записывая его, и до
+    записи ссылки файл могла удалить уборка. Поэтому наличие файла
+    проверяется только после того, как строка заблокирована и ссылка
+    учтена, а пропавший файл записывается заново из content.
+    """
+    if not name or not is_content_name(name):
+        return
+    with transaction.atomic():
+        blobs = ImageBlob.objects.filter(name=name)
+        created = False
+        if not blobs.update(references=F('references') + 1):
+            try:
+                with transaction.atomic():
+                    ImageBlob.objects.create(name=name, size=0, references=1)
+                created = True
+            except IntegrityError:
+                blobs.update(references=F('references') + 1)
+        if not storage().exists(name):
+            if content is None:
+                raise FileNotFoundError(name)
+            storage().restore(name, content)
+            created = True
+        if created:
+            blobs.update(size=storage().size(name))
+
+
+def release(name):
+    """Убирает ссылку на файл name; последняя удаляет его после
+    фиксации транзакции.
+    """
+    if not name or not is_content_name(name):
+        return
+    ImageBlob.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1)
+    transaction.on_commit(lambda: delete_unused(name))
+
+
+def delete_unused(name):
+    """Удаляет файл, его миниатюры и копии, если ссылок не осталось.
+
+    Файл удаляется, пока строка ещё заблокирована удалением: acquire()
+    того же имени ждёт конца транзакции и видит, что файла уже нет.
+    """
+    with transaction.atomic():
+        deleted, _ = ImageBlob.objects.filter(
+            name=name, references=0).delete()
+        if deleted:
+            thumbnails.delete_derived(name)
+            storage().delete(name)
+    return bool(deleted)
+
+
+def savings():
+    """Сколько байт не записано благодаря общим файлам: оригиналов
+    и копий для srcset. Считается по постам, которые есть сейчас.
+    """
+    shared = dict(ImageBlob.objects.filter(
+        references__gt=1).values_list('name', 'references'))
+    originals = ImageBlob.objects.filter(name__in=shared).aggregate(
+        total=Sum(F('size') * (F('references') - 1)))['total'] or 0
+    variants = ImageVariant.objects.filter(source__in=shared).values_list(
+        'source').annotate(Sum('size')).order_by()
+    return {
+        'originals': originals,
+        'variants': sum(
+            size * (shared[source] - 1) for source, size in variants),
+    }
@@ -0,0 +1,108 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import md5
+
+from django.views.decorators.http import condition
+
+from . import feed_cache
+from .models import Group, Post, User
+
+
+def viewer_feeds(request):
+    """Ленты, от которых зависит страница конкретного зрителя."""
+    if request.user.is_authenticated:
+        return [f'follows:{request.user.pk}']
+    return []
+
+
+def index_feeds(request):
+    return ['index']
+
+
+def group_feeds(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    return [f'group:{group_id}'] if group_id else None
+
+
+def profile_feeds(request, username):
+    user_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    return [f'profile:{user_id}'] if user_id else None
+
+
+def post_feeds(request, post_id):
+    # На странице поста выводятся и имя и число постов автора, и
+    # название группы.
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    if post is None:
+        return None
+    author_id, group_id = post
+    feeds = [f'post:{post_id}', f'profile:{author_id}', f'author:{author_id}']
+    if group_id:
+        feeds.append(f'group:{group_id}')
+    return feeds
+
+
+def follow_feeds(request):
+    # Отдельной версии у ленты подписок нет: её меняет любой новый пост,
+    # а подписки и отписки добавляет viewer_feeds.
+    return ['index'] if request.user.is_authenticated else None
+
+
+def feeds(request, feeds_func, *args, **kwargs):
+    """Ленты страницы; ищутся запросом к БД, поэтому один раз на запрос."""
+    if not hasattr(request, 'page_feeds'):
+        request.page_feeds = feeds_func(request, *args, **kwargs)
+    return request.page_feeds
+
+
+def conditional_feed(feeds_func):
+    """Отвечает 304 на If-None-Match / If-Modified-Since, не рендеря
+    шаблон, пока не изменились версии лент страницы.
+
+    ETag учитывает версии лент, адрес с параметрами и зрителя: шапка
+    и кнопка подписки у вошедших пользователей другие. Last-Modified
+    отдаётся только анонимам и только если последнее изменение старше
+    секунды — точнее заголовок различать правки не умеет. Прошлая
+    версия страницы, отданная на время пересчёта (request.outdated),
+    уходит без обоих заголовков.
+    """
+    def etag(request, *args, **kwargs):
+        page_feeds = feeds(request, feeds_func, *args, **kwargs)
+        if page_feeds is None:
+            return None
+        page_feeds = page_feeds + viewer_feeds(request)
+        versions = [feed_cache.feed_version(feed) for feed in page_feeds]
+        viewer = (request.user.get_username()
+                  if request.user.is_authenticated else '')
+        key = f'{request.get_full_path()}|{viewer}|{versions}'
+        return md5(key.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        page_feeds = feeds(request, feeds_func, *args, **kwargs)
+        if page_feeds is None or request.user.is_authenticated:
+            return None
+        changed = feed_cache.feed_changed(*page_feeds)
+        if changed is None or time.time() - changed < 1:
+            return None
+        return datetime.fromtimestamp(changed, timezone.utc)
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if getattr(request, 'outdated', False):
+                # Отдана прошлая версия страницы, пока новую считает
+                # другой запрос: с новым ETag клиент держал бы её и
+                # дальше.
+                del response['ETag']
+                del response['Last-Modified']
+            return response
+        return wrapper
+    return decorator
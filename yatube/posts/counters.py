@@ -0,0 +1,31 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Post, UserCounter
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя на заданные величины."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if UserCounter.objects.filter(user_id=user_id).update(**updates):
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        # Строки ещё нет (или пользователь удаляется каскадом):
+        # уменьшать нечего, расхождение исправит reconcile_counters.
+        return
+    try:
+        with transaction.atomic():
+            UserCounter.objects.create(user_id=user_id, **deltas)
+    except IntegrityError:
+        UserCounter.objects.filter(user_id=user_id).update(**updates)
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta)
+
+
+def for_user(user_id):
+    """Счётчики пользователя; нули, если он ещё ничего не делал."""
+    counter = UserCounter.objects.filter(user_id=user_id).first()
+    return counter or UserCounter(user_id=user_id)
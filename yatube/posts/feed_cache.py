@@ -0,0 +1,114 @@
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+
+from core import swr
+
+from .paginators import (CursorPaginator, page_at, page_from_request,
+                         page_state, request_position, restore_page)
+
+FEED_CACHE_TIMEOUT: int = 60 * 5
+VERSION_KEY = 'feed:version:{}'
+CHANGED_KEY = 'feed:changed:{}'
+PAGE_KEY = 'feed:page:{}:{}'
+# Сколько после своей правки пользователь не получает прошлых версий
+# страниц: дольше аренды пересчёта прошлая версия не отдаётся.
+WRITER_SESSION_KEY = 'feed_cache_wrote_at'
+WRITER_WINDOW: int = swr.LEASE_TIMEOUT
+
+
+def feed_version(feed):
+    """Текущая версия ленты, например 'index', 'group:3' или 'profile:7'.
+
+    Новая версия начинается с текущего времени в миллисекундах, чтобы
+    после вытеснения ключа не совпасть ни с одной из прежних.
+    """
+    key = VERSION_KEY.format(feed)
+    version = cache.get(key)
+    if version is None:
+        now = time.time()
+        cache.add(key, int(now * 1000), None)
+        cache.add(CHANGED_KEY.format(feed), now, None)
+        version = cache.get(key)
+    return version
+
+
+def feed_versions(*feeds):
+    """Версии нескольких лент одним get_many, в порядке feeds."""
+    keys = [VERSION_KEY.format(feed) for feed in feeds]
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else feed_version(feed)
+        for key, feed in zip(keys, feeds)
+    ]
+
+
+def feed_changed(*feeds):
+    """Время последнего изменения лент (timestamp) или None, если
+    хотя бы для одной из них оно неизвестно.
+    """
+    keys = [CHANGED_KEY.format(feed) for feed in feeds]
+    changed = cache.get_many(keys)
+    if len(changed) < len(keys):
+        return None
+    return max(changed.values())
+
+
+def bump(*feeds):
+    """Сдвигает версии лент: все их страницы в кэше сразу устаревают."""
+    now = time.time()
+    for feed in feeds:
+        try:
+            cache.incr(VERSION_KEY.format(feed))
+        except ValueError:
+            # Версии нет в кэше: следующее чтение заведёт новую.
+            pass
+    cache.set_many(
+        {CHANGED_KEY.format(feed): now for feed in feeds}, None)
+
+
+def mark_writer(request):
+    """Помечает в сессии, что пользователь только что что-то изменил."""
+    request.session[WRITER_SESSION_KEY] = time.time()
+
+
+def is_writer(request):
+    session = getattr(request, 'session', None)
+    wrote_at = session.get(WRITER_SESSION_KEY) if session else None
+    return wrote_at is not None and time.time() - wrote_at < WRITER_WINDOW
+
+
+def get_or_compute(request, name, key, compute, version):
+    """swr.get_or_compute для страницы запроса. Автору свежей правки
+    прошлая версия не отдаётся, а отданная другим помечается в
+    request.outdated: ETag новых версий к ней не подходит.
+    """
+    def outdated():
+        request.outdated = True
+    return swr.get_or_compute(
+        name, key, compute, FEED_CACHE_TIMEOUT, version,
+        fresh=is_writer(request), on_outdated=outdated)
+
+
+def cached_paginate(request, feed, queryset, per_page, **kwargs):
+    """paginate() с кэшем страницы по номеру или курсору: ключ —
+    request_position, так что мусор в адресе не плодит записей.
+
+    При попадании в кэш запросов к лентам нет: страница собирается
+    из сохранённых постов, числа объектов и курсоров. После смены
+    версии ленты или по истечении FEED_CACHE_TIMEOUT страницу
+    пересчитывает один запрос, остальные до этого получают прежнюю
+    копию (см. get_or_compute).
+    """
+    version = feed_version(feed)
+    paginator = CursorPaginator(
+        queryset, per_page, count_version=version, **kwargs)
+    position = request_position(request)
+    if position is None:
+        return page_from_request(request, paginator)
+    key = PAGE_KEY.format(feed, md5(repr(position).encode()).hexdigest())
+    state = get_or_compute(
+        request, feed.split(':')[0], key,
+        lambda: page_state(page_at(paginator, position)), version)
+    return restore_page(paginator, state)
@@ -1,9 +1,26 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+from core.uploads import fit_image
 
 from .models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
+    def __init__(self, *args, oversized=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.oversized = oversized
+
+    def clean_image(self):
+        if 'image' in self.oversized:
+            raise forms.ValidationError(
+                f'Файл больше {settings.IMAGE_MAX_BYTES // 2 ** 20} МБ.')
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return fit_image(image)
+        return image
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
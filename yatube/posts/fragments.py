@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import feed_cache, thumbnails
+
+CARD_TEMPLATE = 'includes/post.html'
+CARD_KEY = 'post:card:{}:{}:{}:{}'
+CARD_TIMEOUT: int = 60 * 60 * 24
+
+
+def card_feeds(post):
+    """Версии, от которых зависит карточка кроме самого поста: имя
+    автора и название группы.
+    """
+    feeds = [f'author:{post.author_id}']
+    if post.group_id:
+        feeds.append(f'group-title:{post.group_id}')
+    return feeds
+
+
+def card_key(post, versions):
+    return CARD_KEY.format(
+        post.pk, post.version, post.group_id,
+        '.'.join(str(versions[feed]) for feed in card_feeds(post)))
+
+
+def render_cards(posts):
+    """Отрисованные карточки постов в том же порядке, что и posts.
+
+    Все карточки читаются из кэша одним get_many, шаблон рендерится
+    только для промахов. Ключ включает версии поста, автора и группы,
+    поэтому после правки любого из них карточка собирается заново.
+    """
+    posts = list(posts)
+    feeds = list(dict.fromkeys(
+        feed for post in posts for feed in card_feeds(post)))
+    versions = dict(zip(feeds, feed_cache.feed_versions(*feeds)))
+    keys = {post.pk: card_key(post, versions) for post in posts}
+    cached = cache.get_many(list(keys.values()))
+    thumbnails.attach_urls(
+        post for post in posts if keys[post.pk] not in cached)
+    missed = {}
+    cards = []
+    for post in posts:
+        key = keys[post.pk]
+        card = cached.get(key)
+        if card is None:
+            card = missed[key] = render_to_string(
+                CARD_TEMPLATE, {'post': post})
+        cards.append(mark_safe(card))
+    if missed:
+        cache.set_many(missed, CARD_TIMEOUT)
+    return cards
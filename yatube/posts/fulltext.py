@@ -0,0 +1,217 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Индекс — виртуальная таблица posts_search с rowid поста и колонками
+текста, имени автора и названия группы. Сигналы обновляют его на
+каждое сохранение и удаление. Результаты упорядочены по bm25.
+Оценки bm25 зависят от всего корпуса и сдвигаются с каждым новым
+постом, поэтому листается не оценка, а снимок порядка результатов:
+id в кэше и курсор (снимок, смещение). Снимок один на выражение
+и минуту (SNAPSHOT_BUCKET), так что повторные поиски не плодят
+записей в кэше, а новые посты попадают в выдачу не сразу.
+На других СУБД индекса нет, и поиск сводится к icontains по тексту
+с обычной лентой по дате.
+"""
+import binascii
+import re
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from . import feed_cache
+from .models import Group, Post, User
+from .paginators import CursorPage, CursorPaginator
+
+TABLE = 'posts_search'
+# Веса колонок для bm25: текст, автор, группа. Совпадение в имени
+# автора или группы почти всегда и есть то, что искали.
+WEIGHTS = (1.0, 2.0, 2.0)
+WORD = re.compile(r'\w+')
+SNAPSHOT_KEY = 'search:snapshot:{}:{}:{}'
+SNAPSHOT_BUCKET: int = 60
+# Курсоры на снимки старше этого не принимаются.
+SNAPSHOT_TIMEOUT: int = 60 * 10
+# Дальше этого числа результатов поиск не листается.
+RESULTS_LIMIT: int = 1000
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def create_sql():
+    return (
+        f'CREATE VIRTUAL TABLE {TABLE} USING fts5(text, author, group_title, '
+        f"tokenize='unicode61 remove_diacritics 2')")
+
+
+def _select_sql(where):
+    """Строки индекса для постов по условию where над таблицей постов."""
+    author = "u.username || ' ' || u.first_name || ' ' || u.last_name"
+    return (
+        f'SELECT p.id, p.text, {author}, COALESCE(g.title, \'\') '
+        f'FROM {Post._meta.db_table} p '
+        f'JOIN {User._meta.db_table} u ON u.id = p.author_id '
+        f'LEFT JOIN {Group._meta.db_table} g ON g.id = p.group_id '
+        f'WHERE {where}')
+
+
+def _reindex(where, params=()):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid IN ('
+            f'SELECT p.id FROM {Post._meta.db_table} p WHERE {where})',
+            params)
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text, author, group_title) '
+            f'{_select_sql(where)}', params)
+
+
+def index_posts(*post_ids):
+    if post_ids:
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        _reindex(f'p.id IN ({placeholders})', post_ids)
+
+
+def index_group(group_id):
+    _reindex('p.group_id = %s', [group_id])
+
+
+def index_author(author_id):
+    _reindex('p.author_id = %s', [author_id])
+
+
+def remove(*post_ids):
+    if not available() or not post_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', post_ids)
+
+
+def rebuild():
+    """Собирает индекс заново; возвращает число проиндексированных постов."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        cursor.execute(create_sql())
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text, author, group_title) '
+            f'{_select_sql("1 = 1")}')
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {TABLE}')
+        count = cursor.fetchone()[0]
+    feed_cache.bump('search')
+    return count
+
+
+def match_expression(query):
+    """Безопасный запрос FTS5: каждое слово как префикс, все вместе — И.
+
+    Синтаксис FTS5 из ввода не пропускается: слова берутся в кавычки.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query.lower()))
+
+
+def matching(queryset, query):
+    """Посты из queryset, подходящие под query, без ранжирования."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not available():
+        return queryset.filter(text__icontains=query)
+    # Не pk__in=RawSQL(...): двойные скобки вокруг подзапроса SQLite
+    # читает как скаляр и берёт только первую строку.
+    column = connection.ops.quote_name(Post._meta.db_table) + '."id"'
+    return queryset.extra(
+        where=[f'{column} IN (SELECT rowid FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s)'],
+        params=[expression])
+
+
+def encode_cursor(snapshot, offset):
+    return urlsafe_base64_encode(force_bytes(f'{snapshot}|{offset}'))
+
+
+def decode_cursor(cursor):
+    """Пара (снимок, смещение) или None для битого курсора."""
+    try:
+        raw_snapshot, raw_offset = (
+            urlsafe_base64_decode(cursor).decode().split('|'))
+        snapshot, offset = int(raw_snapshot), int(raw_offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if offset < 0:
+        return None
+    return snapshot, offset
+
+
+def ranked_ids(expression, limit):
+    """До limit id постов, лучшие первыми."""
+    weights = ', '.join(map(str, WEIGHTS))
+    # Чем меньше bm25, тем лучше; при равенстве новые посты первыми.
+    sql = (
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+        f'ORDER BY bm25({TABLE}, {weights}), rowid DESC LIMIT %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expression, limit])
+        return [post_id for post_id, in cursor.fetchall()]
+
+
+def current_snapshot():
+    return int(time.time()) // SNAPSHOT_BUCKET
+
+
+def valid_snapshot(snapshot):
+    """Не из будущего и не старше SNAPSHOT_TIMEOUT: номер снимка
+    приходит от клиента и не должен заводить новых записей в кэше.
+    """
+    age = (current_snapshot() - snapshot) * SNAPSHOT_BUCKET
+    return 0 <= age <= SNAPSHOT_TIMEOUT
+
+
+def snapshot_ids(expression, snapshot):
+    """Порядок результатов в снимке snapshot. Если снимок выпал из
+    кэша раньше срока, он снимается заново под тем же именем.
+    """
+    # Версия 'search' меняется при пересборке индекса: снимки старого
+    # индекса больше не нужны.
+    key = SNAPSHOT_KEY.format(
+        md5(expression.encode()).hexdigest(),
+        feed_cache.feed_version('search'), snapshot)
+    ids = cache.get(key)
+    if ids is None:
+        ids = ranked_ids(expression, RESULTS_LIMIT)
+        cache.set(key, ids, SNAPSHOT_TIMEOUT + SNAPSHOT_BUCKET)
+    return ids
+
+
+def search_page(query, cursor, per_page):
+    """Страница результатов для строки query после курсора cursor."""
+    expression = match_expression(query)
+    if not expression:
+        return CursorPage([], None, None, None)
+    posts = Post.objects.select_related('author', 'group')
+    if not available():
+        paginator = CursorPaginator(
+            posts.filter(text__icontains=query), per_page)
+        if cursor:
+            return paginator.get_cursor_page(before=cursor)
+        return paginator.first_cursor_page()
+    position = decode_cursor(cursor) if cursor else None
+    if position is None or not valid_snapshot(position[0]):
+        position = current_snapshot(), 0
+    snapshot, offset = position
+    ids = snapshot_ids(expression, snapshot)
+    older_cursor = None
+    if len(ids) > offset + per_page:
+        older_cursor = encode_cursor(snapshot, offset + per_page)
+    ids = ids[offset:offset + per_page]
+    found = posts.in_bulk(ids)
+    page = [found[post_id] for post_id in ids if post_id in found]
+    return CursorPage(page, None, None, older_cursor)
@@ -0,0 +1,216 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.models import KVStore
+
+from posts import blobs, thumbnails
+from posts.models import ImageBlob, ImageVariant, Post
+
+ORIGINALS = 'posts'
+VARIANTS = 'posts/variants'
+
+
+def _file(root, entry):
+    """(имя в хранилище, байты, mtime) для записи os.scandir."""
+    stat = entry.stat()
+    name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+    return name, stat.st_size, stat.st_mtime
+
+
+def _walk(root, directory):
+    """Файлы каталога и всех его подкаталогов."""
+    found = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                found += _walk(root, entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                found.append(_file(root, entry))
+    return found
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _referenced_originals(names):
+    return set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True)) | set(ImageBlob.objects.filter(
+            name__in=names, references__gt=0).values_list('name', flat=True))
+
+
+def _referenced_variants(names):
+    return set(ImageVariant.objects.filter(file__in=names).values_list(
+        'file', flat=True))
+
+
+def _thumbnail_names(candidates, chunk_size):
+    """Имена из candidates, на которые есть ключи в хранилище sorl.
+
+    Ключи читаются порциями, и в памяти остаются только совпадения
+    с candidates, а не все имена хранилища.
+    """
+    prefix = f'{thumbnail_settings.THUMBNAIL_KEY_PREFIX}||image||'
+    rows = KVStore.objects.filter(key__startswith=prefix).order_by('key')
+    names, last_key = set(), ''
+    while True:
+        chunk = list(rows.filter(key__gt=last_key).values_list(
+            'key', 'value')[:chunk_size])
+        if not chunk:
+            return names
+        names.update(
+            name for name in (json.loads(value)['name'] for _, value in chunk)
+            if name in candidates)
+        last_key = chunk[-1][0]
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из MEDIA_ROOT картинки, копии и миниатюры, на которые '
+            'больше ничто не ссылается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: их ссылка '
+                 'может быть ещё не записана в базу.')
+        parser.add_argument(
+            '--rate', type=float, default=50,
+            help='Не больше стольких удалений в секунду; 0 — без ограничения.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.storage = blobs.storage()
+        self.next_delete = time.monotonic()
+        files = self.scan()
+        self.cutoff = time.time() - options['min_age']
+        old = [file for file in files if file[2] < self.cutoff]
+        thumbnail_prefix = thumbnail_settings.THUMBNAIL_PREFIX
+        self.thumbnail_files = [
+            file for file in old if file[0].startswith(thumbnail_prefix)]
+        # Миниатюры последними: уборка оригиналов удаляет и их ключи.
+        self.collect(
+            'Оригиналы', _referenced_originals, self.delete_original,
+            [file for file in old if file[0].startswith(f'{ORIGINALS}/')
+             and not file[0].startswith(f'{VARIANTS}/')])
+        self.collect(
+            'Копии для srcset', _referenced_variants, self.delete_variant,
+            [file for file in old if file[0].startswith(f'{VARIANTS}/')])
+        self.collect(
+            'Миниатюры', self.referenced_thumbnails, self.delete_thumbnail,
+            self.thumbnail_files)
+
+    def scan(self):
+        """Обходит каталоги картинок, по подкаталогу на поток пула."""
+        root = self.storage.path('')
+        directories, files = [], []
+        for top in (ORIGINALS, thumbnail_settings.THUMBNAIL_PREFIX):
+            top = os.path.join(root, top)
+            if not os.path.isdir(top):
+                continue
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(_file(root, entry))
+        with ThreadPoolExecutor(self.options['workers']) as pool:
+            for found in pool.map(
+                    lambda directory: _walk(root, directory), directories):
+                files += found
+        return files
+
+    def collect(self, title, referenced, delete, files):
+        """Удаляет файлы, которых нет среди referenced, порциями.
+
+        Проверка порции только отбирает кандидатов: между ней и
+        удалением проходят секунды, поэтому delete(name) перед удалением
+        каждого файла заново смотрит его возраст и ссылки на него.
+        """
+        orphans, size = 0, 0
+        for chunk in _chunks(sorted(files), self.options['chunk_size']):
+            used = referenced([name for name, _, _ in chunk])
+            for name, file_size, _ in chunk:
+                if name in used or not self.storage.exists(name):
+                    continue
+                if self.options['dry_run']:
+                    self.stdout.write(f'  {name}')
+                else:
+                    self.throttle()
+                    if not delete(name):
+                        continue
+                orphans += 1
+                size += file_size
+        verb = 'к удалению' if self.options['dry_run'] else 'удалено'
+        self.stdout.write(
+            f'{title}: файлов {len(files)}, {verb} {orphans} '
+            f'({filesizeformat(size)})')
+
+    def referenced_thumbnails(self, names):
+        if not hasattr(self, 'thumbnail_names'):
+            self.thumbnail_names = _thumbnail_names(
+                {name for name, _, _ in self.thumbnail_files},
+                self.options['chunk_size'])
+        return self.thumbnail_names.intersection(names)
+
+    def old_enough(self, name):
+        """Не тронут ли файл за --min-age: хранилище обновляет mtime,
+        когда новая загрузка совпадает с уже лежащим файлом.
+        """
+        try:
+            return os.stat(self.storage.path(name)).st_mtime < self.cutoff
+        except FileNotFoundError:
+            return False
+
+    def delete_original(self, name):
+        """Удаляет оригинал под той же блокировкой строки ImageBlob,
+        что берёт blobs.acquire(): загрузка того же файла либо успеет
+        записать ссылку, и файл останется, либо дождётся удаления и
+        запишет файл заново.
+        """
+        with transaction.atomic():
+            # Строка нужна, чтобы было что блокировать; откатится вместе
+            # с транзакцией, если файл удалять нельзя.
+            ImageBlob.objects.get_or_create(name=name, defaults={'size': 0})
+            deleted, _ = ImageBlob.objects.filter(
+                name=name, references=0).delete()
+            if (not deleted or Post.objects.filter(image=name).exists()
+                    or not self.old_enough(name)):
+                transaction.set_rollback(True)
+                return False
+            thumbnails.delete_derived(name)
+            self.storage.delete(name)
+        return True
+
+    def delete_variant(self, name):
+        if (not self.old_enough(name)
+                or ImageVariant.objects.filter(file=name).exists()):
+            return False
+        self.storage.delete(name)
+        return True
+
+    def delete_thumbnail(self, name):
+        if not self.old_enough(name):
+            return False
+        self.storage.delete(name)
+        return True
+
+    def throttle(self):
+        if not self.options['rate']:
+            return
+        now = time.monotonic()
+        if self.next_delete > now:
+            time.sleep(self.next_delete - now)
+        self.next_delete = (
+            max(now, self.next_delete) + 1 / self.options['rate'])
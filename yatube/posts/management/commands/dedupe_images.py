@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.template.defaultfilters import filesizeformat
+
+from core.storage import is_content_name
+from posts import blobs, feed_cache
+from posts.models import ImageBlob, Post
+from posts.signals import post_feeds
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов со старыми именами в хранилище '
+            'по содержимому и печатает, сколько места сэкономлено.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только отчёт, ничего не переносить.')
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            moved = self.adopt(options['chunk_size'])
+            self.stdout.write(f'Перенесено картинок: {moved}')
+        self.report()
+
+    def adopt(self, chunk_size):
+        """Пересохраняет старые картинки через хранилище поста. Старые
+        файлы и их миниатюры остаются на диске до уборки.
+        """
+        storage = blobs.storage()
+        posts = Post.objects.filter(image__gt='').only(
+            'pk', 'image', 'author_id', 'group_id').order_by('pk')
+        last_pk, moved = 0, 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                return moved
+            last_pk = chunk[-1].pk
+            legacy = [
+                post for post in chunk
+                if not is_content_name(post.image.name)
+                and storage.exists(post.image.name)
+            ]
+            for post in legacy:
+                with storage.open(post.image.name) as file:
+                    with transaction.atomic():
+                        name = storage.save(post.image.name, file)
+                        Post.objects.filter(pk=post.pk).update(
+                            image=name, version=F('version') + 1)
+                        blobs.acquire(name, file)
+            feed_cache.bump(*{
+                feed for post in legacy
+                for feed in post_feeds(post, post.group_id)
+            })
+            moved += len(legacy)
+
+    def report(self):
+        totals = ImageBlob.objects.aggregate(
+            files=Count('pk'), posts=Sum('references'), size=Sum('size'))
+        legacy = Post.objects.filter(image__gt='').exclude(
+            image__in=ImageBlob.objects.values('name'))
+        saved = blobs.savings()
+        self.stdout.write(
+            f'Файлов: {totals["files"]}, '
+            f'постов с ними: {totals["posts"] or 0}, '
+            f'на диске: {filesizeformat(totals["size"] or 0)}\n'
+            f'Сэкономлено: оригиналы {filesizeformat(saved["originals"])}, '
+            f'копии для srcset {filesizeformat(saved["variants"])}\n'
+            f'Постов со старыми именами картинок: {legacy.count()}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import fulltext
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов с нуля.'
+
+    def handle(self, *args, **options):
+        if not fulltext.available():
+            raise CommandError('Поисковый индекс есть только в SQLite.')
+        count = fulltext.rebuild()
+        self.stdout.write(f'В индексе постов: {count}')
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Comment, Follow, Post, User, UserCounter
+from posts.timeline import forget_celebrities
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def _chunks(queryset, chunk_size):
+    """Отдаёт первичные ключи порциями, листая по pk без OFFSET."""
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def _counts(queryset, field, pks):
+    return dict(queryset.filter(**{f'{field}__in': pks}).values_list(
+        field).annotate(Count('pk')).order_by())
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с таблицами и чинит их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        users_fixed = self.reconcile_users(options)
+        posts_fixed = self.reconcile_posts(options)
+        if users_fixed and not options['dry_run']:
+            forget_celebrities()
+        self.stdout.write(
+            f'Исправлено счётчиков пользователей: {users_fixed}, '
+            f'постов: {posts_fixed}')
+
+    def reconcile_users(self, options):
+        fixed = 0
+        for pks in _chunks(User.objects.all(), options['chunk_size']):
+            with transaction.atomic():
+                actual = {
+                    'posts_count': _counts(Post.objects, 'author_id', pks),
+                    'followers_count': _counts(
+                        Follow.objects, 'author_id', pks),
+                    'following_count': _counts(
+                        Follow.objects, 'user_id', pks),
+                }
+                stored = UserCounter.objects.select_for_update().in_bulk(pks)
+                drifted, missing = [], []
+                for pk in pks:
+                    counter = stored.get(pk)
+                    if counter is None:
+                        counter = UserCounter(user_id=pk)
+                        missing.append(counter)
+                    changed = False
+                    for field in USER_FIELDS:
+                        value = actual[field].get(pk, 0)
+                        if getattr(counter, field) != value:
+                            setattr(counter, field, value)
+                            changed = True
+                    if changed and pk in stored:
+                        drifted.append(counter)
+                fixed += len(drifted) + len(missing)
+                if not options['dry_run']:
+                    UserCounter.objects.bulk_update(drifted, USER_FIELDS)
+                    UserCounter.objects.bulk_create(missing)
+        return fixed
+
+    def reconcile_posts(self, options):
+        fixed = 0
+        for pks in _chunks(Post.objects.all(), options['chunk_size']):
+            with transaction.atomic():
+                actual = _counts(Comment.objects, 'post_id', pks)
+                drifted = []
+                for post in Post.objects.select_for_update().filter(
+                        pk__in=pks).only('pk', 'comments_count'):
+                    value = actual.get(post.pk, 0)
+                    if post.comments_count != value:
+                        post.comments_count = value
+                        drifted.append(post)
+                fixed += len(drifted)
+                if not options['dry_run']:
+                    Post.objects.bulk_update(drifted, ['comments_count'])
+        return fixed
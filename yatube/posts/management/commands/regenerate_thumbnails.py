@@ -0,0 +1,170 @@
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import md5
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
+
+from posts import feed_cache, thumbnails
+from posts.models import ImageVariant, Post
+from posts.signals import post_feeds
+
+DEFAULT_CHECKPOINT = os.path.join(
+    tempfile.gettempdir(), 'yatube-regenerate-thumbnails.json')
+
+
+def _sizes_signature():
+    return md5(json.dumps(
+        thumbnails.SIZES, sort_keys=True).encode()).hexdigest()
+
+
+def _error(error):
+    return f'{type(error).__name__}: {error}'
+
+
+def _render(item):
+    """Выполняется в процессе пула; ошибка возвращается, а не бросается,
+    чтобы одна битая картинка не останавливала весь проход.
+    """
+    name, variants = item
+    try:
+        return name, thumbnails.render(name, variants), None
+    except Exception as error:
+        return name, [], _error(error)
+
+
+class Command(BaseCommand):
+    help = ('Заново готовит миниатюры и копии для srcset всех картинок '
+            'постов, например после смены размеров в шаблонах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Размер пула процессов; 0 — всё в текущем процессе.')
+        parser.add_argument(
+            '--variants', action='store_true',
+            help='Пересобрать и уже готовые копии для srcset: нужно, '
+                 'если поменялись пропорции карточки.')
+        parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить с места, сохранённого в --checkpoint.')
+
+    def handle(self, *args, **options):
+        state = self.load_checkpoint(options)
+        posts = Post.objects.filter(image__gt='').only(
+            'pk', 'image', 'author_id', 'group_id')
+        # Упавшие в прошлый раз посты проходятся заново первыми.
+        retry = list(posts.filter(pk__in=state['failed']).order_by('pk'))
+        state['failed'] = [post.pk for post in retry]
+        total = (state['done'] + len(retry)
+                 + posts.filter(pk__gt=state['last_pk']).count())
+        pool = None
+        if options['processes']:
+            # Дочерние процессы не должны делить соединения с родителем.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                options['processes'],
+                initializer=thumbnails.init_render_process)
+        started, started_done = time.monotonic(), state['done']
+        try:
+            while True:
+                chunk = retry or list(posts.filter(
+                    pk__gt=state['last_pk']).order_by(
+                        'pk')[:options['chunk_size']])
+                if not chunk:
+                    break
+                self.process(chunk, pool, options, state)
+                if not retry:
+                    state['last_pk'] = chunk[-1].pk
+                retry = None
+                self.save_checkpoint(options['checkpoint'], state)
+                rate = (state['done'] - started_done) / max(
+                    time.monotonic() - started, 1e-6)
+                processed = state['done'] + len(state['failed'])
+                self.stdout.write(
+                    f'{processed}/{total} '
+                    f'({processed * 100 // max(total, 1)}%), '
+                    f'{rate:.1f} картинок/с, pk до {state["last_pk"]}')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if not state['failed'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(
+            f'Готово: {state["done"]} картинок, '
+            f'ошибок: {len(state["failed"])}')
+        if state['failed']:
+            self.stdout.write(
+                'Упавшие посты сохранены в прогрессе: --resume '
+                'попробует их снова.')
+
+    def process(self, chunk, pool, options, state):
+        # Одна картинка может быть у нескольких постов, рисуется она
+        # один раз.
+        pks = defaultdict(list)
+        for post in chunk:
+            pks[post.image.name].append(post.pk)
+        ready = set() if options['variants'] else set(
+            ImageVariant.objects.filter(source__in=pks).values_list(
+                'source', flat=True))
+        items = [(name, name not in ready) for name in pks]
+        if pool is None:
+            results = map(_render, items)
+        else:
+            results = pool.map(
+                _render, items,
+                chunksize=max(len(items) // (options['processes'] * 4), 1))
+        # В БД пишет только этот процесс: пул лишь рисует файлы.
+        failed = {}
+        for name, variants, error in results:
+            if error is None:
+                try:
+                    thumbnails.store(
+                        name, variants, replace=options['variants'])
+                except Exception as exception:
+                    error = _error(exception)
+            if error is not None:
+                for pk in pks[name]:
+                    failed[pk] = error
+                    self.stderr.write(f'pk={pk}: {error}')
+        done = [post for post in chunk if post.pk not in failed]
+        # Новые версии сбрасывают закэшированные карточки и страницы
+        # с этими постами — разом на всю порцию.
+        Post.objects.filter(pk__in=[post.pk for post in done]).update(
+            version=F('version') + 1)
+        feed_cache.bump(*{
+            feed for post in done for feed in post_feeds(post, post.group_id)
+        })
+        state['done'] += len(done)
+        state['failed'] = sorted(
+            {*state['failed'], *failed} - {post.pk for post in done})
+
+    def load_checkpoint(self, options):
+        state = {'last_pk': 0, 'done': 0, 'failed': [],
+                 'sizes': _sizes_signature()}
+        if not options['resume']:
+            return state
+        try:
+            with open(options['checkpoint']) as checkpoint:
+                saved = json.load(checkpoint)
+        except FileNotFoundError:
+            raise CommandError(
+                f'Нет сохранённого прогресса в {options["checkpoint"]}.')
+        if saved['sizes'] != state['sizes']:
+            raise CommandError(
+                'Размеры миниатюр изменились после сохранения прогресса: '
+                'запустите команду без --resume.')
+        return saved
+
+    def save_checkpoint(self, path, state):
+        # Сначала во временный файл: прерванная запись не портит прогресс.
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(f'{path}.tmp', path)
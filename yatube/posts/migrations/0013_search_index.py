@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:20
+
+from django.db import migrations
+
+CREATE_INDEX = (
+    'CREATE VIRTUAL TABLE posts_search USING fts5('
+    "text, author, group_title, tokenize='unicode61 remove_diacritics 2')"
+)
+FILL_INDEX = (
+    'INSERT INTO posts_search (rowid, text, author, group_title) '
+    "SELECT p.id, p.text, u.username || ' ' || u.first_name || ' ' || "
+    "u.last_name, COALESCE(g.title, '') FROM posts_post p "
+    'JOIN auth_user u ON u.id = p.author_id '
+    'LEFT JOIN posts_group g ON g.id = p.group_id'
+)
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД поиск идёт без индекса.
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_INDEX)
+        schema_editor.execute(FILL_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_image_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -2,6 +2,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -41,16 +42,49 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         help_text='Загрузите картинку'
     )
+    comments_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев'
+    )
+    version = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия поста'
+    )
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Версия растёт в самой БД: иначе экземпляр, загруженный до
+        # чужой правки, записал бы обратно старый номер.
+        bump = not self._state.adding
+        if bump:
+            self.version = models.F('version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -80,6 +114,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created'], name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -93,3 +131,133 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write) и при подписке,
+    поэтому страница /follow/ читается одним диапазоном по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Владелец ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx'),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+
+class UserCounter(models.Model):
+    """Счётчики пользователя, которые поддерживаются сигналами.
+
+    Страницы профиля и поста читают их вместо COUNT по Post и Follow.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.IntegerField(
+        default=0,
+        verbose_name='Число постов'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Число подписчиков'
+    )
+    following_count = models.IntegerField(
+        default=0,
+        verbose_name='Число подписок'
+    )
+
+
+class ImageVariant(models.Model):
+    """Уменьшенная копия картинки поста для srcset.
+
+    Привязана к имени исходного файла, а не к посту: у одинаковых
+    картинок разных постов копии общие.
+    """
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    FORMATS = [(WEBP, 'WebP'), (JPEG, 'JPEG')]
+
+    source = models.CharField(
+        max_length=255,
+        verbose_name='Исходная картинка'
+    )
+    format = models.CharField(
+        max_length=4,
+        choices=FORMATS,
+        verbose_name='Формат'
+    )
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+    file = models.FileField(
+        upload_to='posts/variants/',
+        verbose_name='Файл'
+    )
+    size = models.PositiveIntegerField(verbose_name='Размер, байт')
+    processing_ms = models.FloatField(verbose_name='Время обработки, мс')
+
+    class Meta:
+        ordering = ['source', 'format', 'width']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'format', 'width'],
+                name='unique_image_variant'),
+        ]
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в хранилище по содержимому и число постов,
+    которые на него ссылаются. Файл без ссылок удаляется.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    size = models.PositiveIntegerField(verbose_name='Размер, байт')
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов'
+    )
+
+    def __str__(self):
+        return self.name
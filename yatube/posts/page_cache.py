@@ -0,0 +1,64 @@
+from functools import wraps
+from hashlib import md5
+
+from django.http import HttpResponse
+
+from core import fragments
+
+from . import feed_cache
+from .conditional import feeds
+from .paginators import request_position
+
+PAGE_KEY = 'page:{}'
+
+
+class Uncacheable(Exception):
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+
+def cached_page(feeds_func):
+    """Кэширует одну общую для всех зрителей разметку страницы.
+
+    Оболочка рендерится с дырами вместо пользовательских фрагментов
+    (см. core.fragments) и хранится, пока не сменятся версии лент
+    из feeds_func. На каждый запрос в неё подставляются фрагменты
+    текущего пользователя, так что вью вызывается только при промахе.
+    Ключ — путь и request_position: прочие параметры адреса страницу
+    не меняют. Вместе с разметкой хранятся и заголовки ответа вью.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page_feeds = feeds(request, feeds_func, *args, **kwargs)
+            position = request_position(request)
+            if (request.method not in ('GET', 'HEAD') or page_feeds is None
+                    or position is None):
+                return view(request, *args, **kwargs)
+
+            def render_shell():
+                request.page_shell = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request.page_shell = False
+                if response.status_code != 200:
+                    raise Uncacheable(response)
+                return (response.content.decode(response.charset),
+                        list(response.items()))
+
+            key = PAGE_KEY.format(
+                md5(f'{request.path}|{position!r}'.encode()).hexdigest())
+            versions = [feed_cache.feed_version(feed) for feed in page_feeds]
+            try:
+                shell, headers = feed_cache.get_or_compute(
+                    request, 'page', key, render_shell, versions)
+            except Uncacheable as error:
+                return error.response
+            response = HttpResponse(fragments.fill(shell, request))
+            for header, value in headers:
+                response[header] = value
+            return response
+        return wrapper
+    return decorator
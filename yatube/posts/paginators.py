@@ -0,0 +1,439 @@
+import binascii
+import heapq
+import re
+from hashlib import md5
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+PAGE_WINDOW: int = 2
+EXACT_COUNT_LIMIT: int = 1000
+COUNT_CACHE_TIMEOUT: int = 30
+COUNT_CACHE_KEY = 'paginator:count:{}:{}'
+EXACT_COUNT_CACHE_TIMEOUT: int = 60 * 10
+EXACT_COUNT_KEY = 'paginator:exact-count:{}'
+
+
+def planner_estimate(queryset):
+    """Оценка планировщика PostgreSQL; в остальных БД нижняя граница."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return 0
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        match = re.search(r'rows=(\d+)', cursor.fetchone()[0])
+    return int(match[1]) if match else 0
+
+
+def table_estimate(queryset):
+    """Примерное число строк всей таблицы без её обхода: статистика
+    PostgreSQL, а если её нет — наибольший первичный ключ.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    return queryset.model._default_manager.using(queryset.db).aggregate(
+        last=Max('pk'))['last'] or 0
+
+
+def estimate(queryset):
+    """Число строк выборки, у которой их больше EXACT_COUNT_LIMIT.
+
+    Вся таблица — table_estimate, выборка с фильтром — planner_estimate.
+    Где планировщика нет (SQLite), выборка с фильтром считается точно,
+    но не чаще раза в EXACT_COUNT_CACHE_TIMEOUT секунд.
+    """
+    if not queryset.query.where:
+        return table_estimate(queryset)
+    if connections[queryset.db].vendor == 'postgresql':
+        return planner_estimate(queryset)
+    sql, params = queryset.query.sql_with_params()
+    key = EXACT_COUNT_KEY.format(md5(f'{sql}|{params}'.encode()).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, EXACT_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class PostRow(dict):
+    """Словарь колонок поста, у которого ключ ленты читается как у Post."""
+
+    @property
+    def pk(self):
+        return self['id']
+
+    @property
+    def pub_date(self):
+        return self['pub_date']
+
+
+def encode_cursor(post):
+    return encode_key(post.pub_date, post.pk)
+
+
+def encode_key(pub_date, pk):
+    return urlsafe_base64_encode(force_bytes(f'{pub_date.isoformat()}|{pk}'))
+
+
+def decode_cursor(cursor):
+    """Возвращает пару (pub_date, pk) или None для битого курсора."""
+    try:
+        raw_date, raw_pk = (
+            urlsafe_base64_decode(cursor).decode().split('|'))
+        pub_date = parse_datetime(raw_date)
+        pk = int(raw_pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def elided_page_range(number, num_pages, on_each_side=PAGE_WINDOW,
+                      on_ends=1, truncated=False):
+    """Номера страниц для навигации: края, окно вокруг текущей и None
+    на месте пропусков. Длина не зависит от num_pages.
+
+    truncated — за num_pages есть ещё страницы, только не по номеру:
+    правого края нет, список кончается пропуском после окна.
+    """
+    if num_pages <= (on_each_side + on_ends) * 2 + 1 and not truncated:
+        return list(range(1, num_pages + 1))
+    number = min(number, num_pages)
+    pages = []
+    if number > on_ends + on_each_side + 2:
+        pages += [*range(1, on_ends + 1), None]
+        pages += range(number - on_each_side, number + 1)
+    else:
+        pages += range(1, number + 1)
+    if truncated:
+        pages += range(number + 1, min(number + on_each_side, num_pages) + 1)
+        pages.append(None)
+    elif number < num_pages - on_each_side - on_ends - 1:
+        pages += range(number + 1, number + on_each_side + 1)
+        pages += [None, *range(num_pages - on_ends + 1, num_pages + 1)]
+    else:
+        pages += range(number + 1, num_pages + 1)
+    return pages
+
+
+class CursorPage(Page):
+    """Страница ленты, выбранная по ключу (pub_date, id) без COUNT/OFFSET."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, newer_cursor, older_cursor):
+        super().__init__(object_list, None, paginator)
+        self.newer_cursor = newer_cursor
+        self.older_cursor = older_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.older_cursor is not None
+
+    def has_previous(self):
+        return self.newer_cursor is not None
+
+    def start_index(self):
+        return 1 if self.object_list else 0
+
+    def end_index(self):
+        return len(self.object_list)
+
+
+class CursorPaginator(Paginator):
+    """Paginator, который умеет отдавать и номерные, и курсорные страницы.
+
+    Номерные страницы (?page=N) работают как раньше, но в шаблоне
+    ссылками выводятся только первые FEED_PAGE_NUMBER_LIMIT из них, причём
+    окном (elided_page_range); дальше навигация идёт по курсорам
+    ?before=/?after=.
+
+    Число объектов берётся из переданного count (например, UserCounter),
+    иначе из кэша на COUNT_CACHE_TIMEOUT секунд. Точно считаются только
+    выборки до EXACT_COUNT_LIMIT строк, для больших берётся оценка.
+    """
+
+    pk_field = 'pk'
+    # Путь от строк object_list к полям поста.
+    post_prefix = ''
+    columns = None
+    # По номеру только первая страница, дальше — курсоры.
+    cursor_only = False
+
+    def __init__(self, object_list, per_page, count=None, count_version=None,
+                 **kwargs):
+        super().__init__(
+            object_list.order_by('-pub_date', f'-{self.pk_field}'),
+            per_page, **kwargs)
+        self.count_version = count_version
+        if count is not None:
+            # Готовое значение, например из UserCounter, вместо COUNT(*).
+            self.count = count
+
+    def to_posts(self, object_list):
+        return list(object_list)
+
+    def only_columns(self, columns):
+        """Дальше отдаёт вместо постов PostRow только с колонками columns
+        (имена полей Post, можно через __) — одним запросом .values().
+
+        Ключ ленты (id, pub_date) выбирается всегда.
+        """
+        self.columns = ['id', 'pub_date'] + [
+            column for column in columns if column not in ('id', 'pub_date')]
+        self.object_list = self.object_list.values(
+            *(self.post_prefix + column for column in self.columns))
+        return self
+
+    def load(self, object_list):
+        if self.columns is None:
+            return self.to_posts(object_list)
+        prefix = self.post_prefix
+        return [
+            PostRow((column, row[prefix + column]) for column in self.columns)
+            for row in object_list
+        ]
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            return 0
+        key = COUNT_CACHE_KEY.format(
+            md5(sql.encode()).hexdigest(), self.count_version)
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list[:EXACT_COUNT_LIMIT + 1].count()
+            if count > EXACT_COUNT_LIMIT:
+                count = max(count, self.estimate_count())
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def estimate_count(self):
+        return estimate(self.object_list)
+
+    def page(self, number):
+        # Срез не ограничивается count: закэшированное значение могло
+        # устареть, а страница всё равно должна быть полной.
+        number = 1 if self.cursor_only else self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
+
+    @property
+    def number_limit(self):
+        return 1 if self.cursor_only else settings.FEED_PAGE_NUMBER_LIMIT
+
+    @property
+    def number_pages(self):
+        """Сколько страниц доступно по номеру, остальные — по курсору."""
+        return min(self.num_pages, self.number_limit)
+
+    def _get_page(self, object_list, number, *args, **kwargs):
+        page = super()._get_page(
+            self.load(object_list), number, *args, **kwargs)
+        page.elided_page_range = elided_page_range(
+            number, self.number_pages,
+            truncated=self.num_pages > self.number_pages)
+        page.is_cursor = False
+        page.newer_cursor = None
+        page.older_cursor = (
+            encode_cursor(page[len(page) - 1]) if page.has_next() else None)
+        return page
+
+    def walk(self, key, older, limit):
+        """До limit постов строго старше (или новее) ключа, по порядку обхода.
+
+        Для older=True посты идут от новых к старым, иначе наоборот.
+        Без ключа (key=None) — самые новые.
+        """
+        if key is None:
+            return self.load(self.object_list[:limit])
+        pub_date, pk = key
+        if older:
+            queryset = self.object_list.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, **{f'{self.pk_field}__lt': pk}))
+        else:
+            queryset = self.object_list.filter(
+                Q(pub_date__gt=pub_date)
+                | Q(pub_date=pub_date, **{f'{self.pk_field}__gt': pk})
+            ).reverse()
+        return self.load(queryset[:limit])
+
+    def get_cursor_page(self, before=None, after=None):
+        key = decode_cursor(before or after)
+        if key is None:
+            return self.get_page(1)
+        posts = self.walk(key, bool(before), self.per_page + 1)
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        if before:
+            newer_cursor = encode_cursor(posts[0]) if posts else None
+            older_cursor = encode_cursor(posts[-1]) if has_more else None
+        else:
+            posts.reverse()
+            newer_cursor = encode_cursor(posts[0]) if has_more else None
+            older_cursor = encode_cursor(posts[-1]) if posts else None
+        return CursorPage(posts, self, newer_cursor, older_cursor)
+
+    def first_cursor_page(self):
+        """Первая страница курсорной, без COUNT(*) и номеров страниц."""
+        posts = self.walk(None, True, self.per_page + 1)
+        older_cursor = (
+            encode_cursor(posts[self.per_page - 1])
+            if len(posts) > self.per_page else None)
+        return CursorPage(posts[:self.per_page], self, None, older_cursor)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для админки больших таблиц.
+
+    Точно считаются только первые EXACT_COUNT_LIMIT строк; если их
+    больше, берётся estimate.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        count = queryset.order_by()[:EXACT_COUNT_LIMIT + 1].count()
+        if count <= EXACT_COUNT_LIMIT:
+            return count
+        return max(count, estimate(queryset))
+
+
+class TimelinePaginator(CursorPaginator):
+    """Листает TimelineEntry, а на страницу отдаёт сами посты."""
+
+    pk_field = 'post_id'
+    post_prefix = 'post__'
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(
+            object_list.select_related('post__author', 'post__group'),
+            per_page, **kwargs)
+
+    def to_posts(self, object_list):
+        return [entry.post for entry in object_list]
+
+
+def _feed_key(post):
+    return post.pub_date, post.pk
+
+
+class MergedPaginator(CursorPaginator):
+    """Сливает по (pub_date, id) несколько уже упорядоченных лент.
+
+    Каждый источник читается своим индексом и не глубже одной страницы,
+    поэтому общей сортировки в БД нет. По номеру доступна только первая
+    страница: для N-й пришлось бы читать из каждого источника все
+    предыдущие.
+    """
+
+    cursor_only = True
+
+    def __init__(self, sources, per_page, **kwargs):
+        Paginator.__init__(self, [], per_page, **kwargs)
+        self.sources = sources
+
+    @cached_property
+    def count(self):
+        return sum(source.count for source in self.sources)
+
+    def only_columns(self, columns):
+        for source in self.sources:
+            source.only_columns(columns)
+        return self
+
+    def page(self, number):
+        return self._get_page(self.walk(None, True, self.per_page), 1, self)
+
+    def walk(self, key, older, limit):
+        merged = heapq.merge(
+            *(source.walk(key, older, limit) for source in self.sources),
+            key=_feed_key, reverse=older)
+        return list(islice(merged, limit))
+
+
+def page_state(page):
+    """Всё, что нужно, чтобы восстановить страницу без запросов к БД."""
+    return {
+        'posts': list(page.object_list),
+        'number': page.number,
+        'count': None if page.is_cursor else page.paginator.count,
+        'newer_cursor': page.newer_cursor,
+        'older_cursor': page.older_cursor,
+    }
+
+
+def restore_page(paginator, state):
+    if state['number'] is None:
+        return CursorPage(
+            state['posts'], paginator,
+            state['newer_cursor'], state['older_cursor'])
+    paginator.count = state['count']
+    return paginator._get_page(state['posts'], state['number'], paginator)
+
+
+def request_position(request):
+    """Позиция страницы из запроса в каноническом виде для ключей кэша:
+    ('before' или 'after', курсор) либо ('page', номер).
+
+    Нечитаемый курсор и мусор в ?page= дают первую страницу, прочие
+    параметры не учитываются. Номера дальше FEED_PAGE_NUMBER_LIMIT
+    ссылками не выводятся и не кэшируются: для них None.
+    """
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if before or after:
+        name, cursor = ('before', before) if before else ('after', after)
+        key = decode_cursor(cursor)
+        return (name, encode_key(*key)) if key else ('page', 1)
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        number = 1
+    if number > settings.FEED_PAGE_NUMBER_LIMIT:
+        return None
+    return 'page', number
+
+
+def page_at(paginator, position):
+    name, value = position
+    if name == 'page':
+        return paginator.get_page(value)
+    return paginator.get_cursor_page(**{name: value})
+
+
+def page_from_request(request, paginator):
+    position = request_position(request)
+    if position is None:
+        return paginator.get_page(request.GET.get('page'))
+    return page_at(paginator, position)
+
+
+def paginate(request, queryset, per_page, paginator_class=CursorPaginator,
+             **kwargs):
+    return page_from_request(
+        request, paginator_class(queryset, per_page, **kwargs))
@@ -0,0 +1,146 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import blobs, counters, feed_cache, fulltext, timeline
+from .models import Comment, Follow, Group, Post, User
+
+AUTHOR_NAME_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def post_feeds(post, *group_ids):
+    feeds = ['index', f'profile:{post.author_id}', f'post:{post.pk}']
+    feeds += [f'group:{group_id}' for group_id in group_ids if group_id]
+    return feeds
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved_post(sender, instance, **kwargs):
+    saved = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'image').first() if instance.pk else None
+    instance.saved_group_id, instance.saved_image = saved or (None, None)
+    # Содержимое новой картинки: понадобится, если файл с тем же
+    # именем пропадёт до того, как на него будет записана ссылка.
+    image = instance.image
+    instance.image_content = (
+        image.file if image and not image._committed else None)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        timeline.push_post(instance)
+    saved_image = getattr(instance, 'saved_image', None)
+    if instance.image.name != saved_image:
+        # Файлы общие для одинаковых картинок: считаем ссылки на них.
+        blobs.acquire(
+            instance.image.name, getattr(instance, 'image_content', None))
+        blobs.release(saved_image)
+    fulltext.index_posts(instance.pk)
+    saved_group_id = getattr(instance, 'saved_group_id', None)
+    feed_cache.bump(
+        *post_feeds(instance, instance.group_id, saved_group_id))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+    blobs.release(instance.image.name)
+    fulltext.remove(instance.pk)
+    feed_cache.bump(*post_feeds(instance, instance.group_id))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+    feed_cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    feed_cache.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название и адрес группы выводятся в лентах главной и профилей.
+    author_ids = instance.posts.values_list('author_id', flat=True).distinct()
+    feed_cache.bump(
+        'index', f'group:{instance.pk}', f'group-title:{instance.pk}',
+        *(f'profile:{author_id}' for author_id in author_ids))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    # Название группы есть в поисковом индексе её постов.
+    fulltext.index_group(instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_posts(sender, instance, **kwargs):
+    instance.post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    fulltext.index_posts(*instance.post_ids)
+
+
+def author_feeds(user_id):
+    """Ленты, где видно имя пользователя: его профиль, карточки и
+    страницы его постов (author:), общая лента и группы с его постами.
+
+    Версии отдельных постов не трогаются, чтобы переименование не
+    обходило все посты автора. Имена комментаторов на страницах постов
+    обновятся с истечением их кэша.
+    """
+    posts = Post.objects.filter(author_id=user_id)
+    group_ids = posts.exclude(group=None).values_list(
+        'group_id', flat=True).distinct()
+    feeds = [f'profile:{user_id}', f'author:{user_id}']
+    if posts.exists():
+        feeds.append('index')
+    feeds += [f'group:{group_id}' for group_id in group_ids]
+    return feeds
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields, **kwargs):
+    # Вход сохраняет только last_login: имена перечитывать незачем.
+    instance.saved_names = None
+    if instance.pk and (
+            update_fields is None or update_fields & AUTHOR_NAME_FIELDS):
+        instance.saved_names = User.objects.filter(pk=instance.pk).values(
+            *AUTHOR_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    saved = getattr(instance, 'saved_names', None)
+    if saved is None or all(
+            getattr(instance, field) == value
+            for field, value in saved.items()):
+        return
+    fulltext.index_author(instance.pk)
+    feed_cache.bump(*author_feeds(instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.user_id, following_count=1)
+        counters.bump_user(instance.author_id, followers_count=1)
+        timeline.follow_added(instance.user_id, instance.author_id)
+        feed_cache.bump(f'follows:{instance.user_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    timeline.follow_removed(instance.user_id, instance.author_id)
+    feed_cache.bump(f'follows:{instance.user_id}')
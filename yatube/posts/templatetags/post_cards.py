@@ -0,0 +1,12 @@
+from django import template
+
+from posts.fragments import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Пары (пост, карточка) для цикла по странице ленты."""
+    posts = list(posts)
+    return list(zip(posts, render_cards(posts)))
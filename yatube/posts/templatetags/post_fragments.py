@@ -0,0 +1,18 @@
+from django import template
+
+from posts.forms import CommentForm
+from posts.models import Follow
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, username):
+    user = context['user']
+    return user.is_authenticated and Follow.objects.filter(
+        user=user, author__username=username).exists()
+
+
+@register.simple_tag
+def comment_form():
+    return CommentForm()
@@ -0,0 +1,16 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post):
+    """Картинка карточки с srcset по всем готовым копиям."""
+    src = thumbnails.image_url(post, 'card')
+    return {
+        'src': src,
+        'srcset': post.image_srcset,
+        'sizes': thumbnails.SRCSET_SIZES,
+    }
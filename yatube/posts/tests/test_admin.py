@@ -0,0 +1,132 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import EXACT_COUNT_LIMIT, EstimatedCountPaginator
+
+
+class AdminChangelistTests(TestCase):
+    """Число запросов на страницу списка не зависит от числа строк."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(f'user{i}')
+            post = Post.objects.create(
+                text=f'Пост {i}', author=user,
+                group=self.groups[i % len(self.groups)])
+            Comment.objects.create(post=post, author=user, text='Да')
+            Follow.objects.create(user=user, author=self.admin)
+
+    def changelist_queries(self, model, params=None):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertConstantQueries(self, model, expected, params=None):
+        self.add_rows(3)
+        few = self.changelist_queries(model, params)
+        self.add_rows(20)
+        many = self.changelist_queries(model, params)
+        self.assertEqual(len(few), len(many), '\n'.join(many))
+        self.assertEqual(len(many), expected, '\n'.join(many))
+        return many
+
+    def test_post_changelist(self):
+        """Автор и группа приходят в том же запросе, а список групп
+        для list_editable читается один раз на страницу.
+        """
+        queries = self.assertConstantQueries('post', 5)
+        self.assertFalse(any(
+            query.startswith('SELECT COUNT(*)') and 'LIMIT' not in query
+            for query in queries))
+
+    def test_post_search_uses_index(self):
+        queries = self.assertConstantQueries('post', 5, {'q': 'пост'})
+        self.assertTrue(any('posts_search MATCH' in q for q in queries))
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'пост 7'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_comment_changelist(self):
+        self.assertConstantQueries('comment', 4)
+
+    def test_follow_changelist(self):
+        """Фильтры по пользователям не загружают их список."""
+        queries = self.assertConstantQueries('follow', 4)
+        self.assertFalse(any('FROM "auth_user" ORDER' in q for q in queries))
+
+    def test_follow_filter_by_username(self):
+        self.add_rows(2)
+        response = self.client.get(
+            reverse('admin:posts_follow_changelist'),
+            {'user__username': 'user1'})
+        follows = response.context['cl'].result_list
+        self.assertEqual(
+            [follow.user.username for follow in follows], ['user1'])
+
+    def test_post_autocomplete_uses_index(self):
+        self.add_rows(3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_autocomplete'), {'term': 'пост'})
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertTrue(any(
+            'posts_search MATCH' in query['sql']
+            for query in queries.captured_queries))
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_counts_exactly_up_to_limit(self):
+        user = User.objects.create_user('author')
+        Post.objects.bulk_create(
+            Post(text='Пост', author=user) for _ in range(3))
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 3)
+
+    def test_large_table_is_estimated(self):
+        user = User.objects.create_user('author')
+        Post.objects.bulk_create(
+            Post(text='Пост', author=user)
+            for _ in range(EXACT_COUNT_LIMIT + 5))
+        Post.objects.filter(pk=Post.objects.order_by('pk')[0].pk).delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 100)
+        # Наибольший pk: удалённые строки не вычитаются.
+        self.assertEqual(
+            paginator.count, Post.objects.order_by('-pk')[0].pk)
+
+    @mock.patch('posts.paginators.EXACT_COUNT_LIMIT', 2)
+    def test_filtered_count_without_planner(self):
+        """Без планировщика выборка с фильтром не упирается в предел
+        точного подсчёта, а полный COUNT(*) берётся из кэша.
+        """
+        cache.clear()
+        user = User.objects.create_user('author')
+        Post.objects.bulk_create(
+            Post(text='Пост', author=user) for _ in range(5))
+        posts = Post.objects.filter(author=user)
+        self.assertEqual(EstimatedCountPaginator(posts, 2).count, 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(posts, 2).count, 5)
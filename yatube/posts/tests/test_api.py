@@ -0,0 +1,128 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@override_settings(FEED_CELEBRITY_THRESHOLD=2)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Auth')
+        cls.celebrity = User.objects.create_user(username='Celebrity')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.fan = User.objects.create_user(username='Fan')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test-slug', description='Описание')
+        for author in (cls.author, cls.celebrity):
+            for i in range(7):
+                Post.objects.create(
+                    text=f'Пост {i}', author=author, group=cls.group)
+        cls.post = Post.objects.create(text='Без группы', author=cls.author)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.celebrity)
+        Follow.objects.create(user=cls.fan, author=cls.celebrity)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, **params):
+        """id постов со всех страниц ленты по ссылкам next."""
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        ids = []
+        while True:
+            data = response.json()
+            ids += [post['id'] for post in data['results']]
+            if data['next'] is None:
+                return ids
+            response = self.client.get(data['next'])
+
+    def test_feeds_match_html_pages(self):
+        feeds = {
+            'index': {},
+            'group_list': {'slug': 'test-slug'},
+            'profile': {'username': 'Auth'},
+        }
+        for name, kwargs in feeds.items():
+            with self.subTest(name=name):
+                html = self.client.get(
+                    reverse(f'posts:{name}', kwargs=kwargs), {'page': 1})
+                first_page = [
+                    post.pk for post in html.context['page_obj']]
+                ids = self.walk(
+                    reverse(f'posts:api_{name}', kwargs=kwargs),
+                    fields='id')
+                self.assertEqual(ids[:len(first_page)], first_page)
+                self.assertEqual(
+                    len(ids), html.context['page_obj'].paginator.count)
+
+    def test_previous_link(self):
+        first = self.client.get(reverse('posts:api_index')).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_fields_trim_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('posts:api_index'), {'fields': 'text'})
+        self.assertEqual(set(response.json()['results'][0]), {'text'})
+        sql = context.captured_queries[-1]['sql']
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('"posts_post"."image"', sql)
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'author,group,image'})
+        self.assertEqual(response.json()['results'][0], {
+            'author': 'Auth', 'group': None, 'image': None})
+
+    def test_unknown_field(self):
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'text,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_etag(self):
+        url = reverse('posts:api_profile', kwargs={'username': 'Auth'})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed(self):
+        url = reverse('posts:api_follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        ids = self.walk(url, fields='id,author')
+        self.assertEqual(
+            ids, list(Post.objects.values_list('pk', flat=True)))
+
+    def test_post_detail(self):
+        response = self.client.get(
+            reverse('posts:api_post_detail',
+                    kwargs={'post_id': self.post.pk}),
+            {'fields': 'text,comments_count'})
+        data = response.json()
+        self.assertEqual(
+            data['post'], {'text': 'Без группы', 'comments_count': 1})
+        self.assertEqual(
+            [(comment['author'], comment['text'])
+             for comment in data['comments']],
+            [('Reader', 'Комментарий')])
+        response = self.client.get(
+            reverse('posts:api_post_detail', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_read_only(self):
+        response = self.client.post(reverse('posts:api_index'))
+        self.assertEqual(response.status_code, 405)
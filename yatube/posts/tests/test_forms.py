@@ -1,18 +1,16 @@
-import shutil
-import tempfile
+import hashlib
+import io
 
-from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import Client, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Comment, Follow, Group, Post, User
+from posts.tests.utils import TempMediaTestCase
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
-
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostFormTests(TestCase):
+class PostFormTests(TempMediaTestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -48,11 +46,6 @@ class PostFormTests(TestCase):
             image=uploaded
         )
 
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
-        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
-
     def setUp(self):
         self.guest_client = Client()
         self.post_author = Client()
@@ -84,7 +77,9 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertEqual(Post.objects.first().text, form['text'])
         self.assertEqual(Post.objects.first().group.id, form['group'])
-        self.assertEqual(Post.objects.first().image, 'posts/small_test.gif')
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(
+            Post.objects.first().image, f'posts/{digest[:2]}/{digest}.gif')
 
     def test_post_create_guest(self):
         posts_count_initial = Post.objects.count()
@@ -148,3 +143,52 @@ class PostFormTests(TestCase):
                               author=self.user).delete()
         self.assertFalse(Follow.objects.filter(user=self.follower_user,
                          author=self.user).exists())
+
+
+class ImageUploadLimitsTests(TempMediaTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Uploader')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, size=(400, 200)):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        image = SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        return self.client.post(
+            reverse('posts:post_create'), {'text': 'Фото', 'image': image})
+
+    @override_settings(IMAGE_MAX_BYTES=100)
+    def test_too_many_bytes(self):
+        response = self.upload()
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 0 МБ.')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        response = self.upload()
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_large_original_is_downscaled(self):
+        """Крупный оригинал хранится уменьшенным, с EXIF-ориентацией."""
+        self.upload()
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.getexif()[0x0112], 6)
+
+    def test_small_original_is_kept(self):
+        self.upload()
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual(image.size, (400, 200))
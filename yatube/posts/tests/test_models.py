@@ -1,6 +1,9 @@
-﻿from django.test import TestCase
+﻿from io import StringIO
 
-from ..models import Group, Post, User
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post, User, UserCounter
 
 
 class PostModelTest(TestCase):
@@ -24,3 +27,43 @@ class PostModelTest(TestCase):
         self.assertEqual(expected_group_object_name, str(PostModelTest.group))
         expected_post_object_name = PostModelTest.post.text[:15]
         self.assertEqual(expected_post_object_name, str(PostModelTest.post))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Auth')
+        cls.reader = User.objects.create_user(username='Reader')
+
+    def test_counters_follow_rows(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.counters.posts_count, 1)
+        self.assertEqual(self.author.counters.followers_count, 1)
+        self.assertEqual(self.reader.counters.following_count, 1)
+        follow.delete()
+        post.comments.all().delete()
+        post.delete()
+        counter = UserCounter.objects.get(user=self.author)
+        self.assertEqual(counter.posts_count, 0)
+        self.assertEqual(counter.followers_count, 0)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.reader).following_count, 0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        UserCounter.objects.filter(user=self.author).update(posts_count=7)
+        UserCounter.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        call_command('reconcile_counters', chunk_size=1, stdout=StringIO())
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).posts_count, 1)
+        self.assertTrue(UserCounter.objects.filter(user=self.reader).exists())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
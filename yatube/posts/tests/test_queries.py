@@ -0,0 +1,133 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+@override_settings(FEED_CELEBRITY_THRESHOLD=2)
+class FeedQueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Auth')
+        cls.celebrity = User.objects.create_user(username='Celebrity')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.fan = User.objects.create_user(username='Fan')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        for author in (cls.author, cls.celebrity):
+            for i in range(15):
+                post = Post.objects.create(
+                    text=f'Пост {i}', author=author, group=cls.group)
+                Comment.objects.create(
+                    post=post, author=cls.reader, text='Комментарий')
+        cls.post = post
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.celebrity)
+        Follow.objects.create(user=cls.fan, author=cls.celebrity)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def feed_urls(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Auth'}),
+            reverse('posts:follow_index'),
+        ]
+        for url in list(urls):
+            cursor = self.client.get(url).context['page_obj'].older_cursor
+            urls += [
+                f'{url}?page=2',
+                f'{url}?before={cursor}',
+                f'{url}?after={cursor}',
+            ]
+        urls.append(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        return urls
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы целиком и не сортируют
+        во временном B-дереве.
+
+        COUNT(*) для номерных страниц сюда не входит: по всей таблице
+        он по определению читает весь индекс.
+        """
+        for url in self.feed_urls():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url)
+            for query in context.captured_queries:
+                sql = query['sql']
+                if 'posts_' not in sql or not sql.startswith('SELECT'):
+                    continue
+                if sql.startswith('SELECT COUNT(*)'):
+                    continue
+                for step in self.query_plan(sql):
+                    with self.subTest(url=url, sql=sql, step=step):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        self.assertIsNone(FULL_SCAN.match(step))
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Auth', first_name='Имя', last_name='Фамилия')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def seed(self, total):
+        for i in range(Comment.objects.count(), total):
+            commentator = User.objects.create_user(username=f'User{i}')
+            Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=self.group)
+            Comment.objects.create(
+                post=self.post, author=commentator, text='Комментарий')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Число запросов страницы не растёт вместе с числом постов
+        и комментариев на ней."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Auth'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        self.seed(1)
+        small = {url: self.count_queries(url) for url in urls}
+        self.seed(8)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), small[url])
@@ -0,0 +1,384 @@
+import json
+import os
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.models import KVStore
+
+from core.storage import is_content_name
+from posts import blobs, feed_cache, fulltext, thumbnails
+from posts.management.commands import collect_media, regenerate_thumbnails
+from posts.models import ImageBlob, ImageVariant, Post, User
+from posts.tests.utils import TempMediaTestCase
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def small_gif(tag):
+    """Та же картинка, но другой файл: хвост после GIF не читается."""
+    return SMALL_GIF + str(tag).encode()
+
+
+def card_thumbnail(name):
+    """Имя файла миниатюры карточки в хранилище."""
+    geometry, options = thumbnails.SIZES['card']
+    return get_thumbnail(
+        thumbnails.source_file(name), geometry, **options).name
+
+
+class ThumbnailTests(TempMediaTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+
+    def setUp(self):
+        # Одинаковые файлы называются одинаково, а хранилище ключей sorl
+        # кэширует миниатюры и между тестами.
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост', author=self.author,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'))
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_original_until_thumbnail_is_ready(self):
+        """Пока миниатюра в очереди, шаблон получает оригинал."""
+        self.addCleanup(thumbnails._pending.clear)
+        with mock.patch.object(thumbnails, '_executor') as executor:
+            url = thumbnails.image_url(self.post, 'card')
+            thumbnails.image_url(self.post, 'card')
+        self.assertEqual(url, self.post.image.url)
+        executor.submit.assert_called_once_with(
+            thumbnails.generate_in_worker, self.post.pk, self.post.image.name)
+
+    def test_generated_thumbnail_is_used(self):
+        thumbnails.generate(self.post.pk, self.post.image.name, touch=True)
+        url = thumbnails.image_url(self.post, 'card')
+        self.assertNotEqual(url, self.post.image.url)
+        self.assertEqual(
+            url, thumbnails.ready_thumbnail(self.post.image, 'card'))
+
+    def test_generation_bumps_post_version(self):
+        """Готовая миниатюра сбрасывает закэшированную карточку поста."""
+        thumbnails.generate(self.post.pk, self.post.image.name, touch=True)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 1)
+
+    def test_generation_bumps_feeds_without_reindex(self):
+        """Готовая миниатюра сдвигает ленты поста, чтобы их ETag не
+        закреплял оригинал, но пост заново не индексируется.
+        """
+        feeds = ['index', f'profile:{self.author.pk}', f'post:{self.post.pk}']
+        versions = feed_cache.feed_versions(*feeds)
+        with mock.patch.object(fulltext, 'index_posts') as index_posts:
+            thumbnails.generate(
+                self.post.pk, self.post.image.name, touch=True)
+        for feed, version in zip(feeds, versions):
+            self.assertNotEqual(feed_cache.feed_version(feed), version)
+        index_posts.assert_not_called()
+
+    def test_page_is_resolved_in_one_lookup(self):
+        """Адреса миниатюр страницы берутся одним чтением кэша, srcset
+        при промахе — одним запросом к БД, а после прогрева — вообще
+        без запросов.
+        """
+        posts = [self.post] + [
+            Post.objects.create(
+                text='Пост', author=self.author,
+                image=SimpleUploadedFile(
+                    f'{i}.gif', small_gif(i), 'image/gif'))
+            for i in range(3)
+        ]
+        thumbnails.attach_urls(posts)
+        cache.delete_many(
+            [thumbnails.srcset_key(post.image.name) for post in posts])
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            thumbnails.attach_urls(posts)
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            thumbnails.attach_urls(posts)
+        for post in posts:
+            self.assertNotEqual(post.image_urls['card'], post.image.url)
+
+    def test_variants_for_srcset(self):
+        thumbnails.generate(self.post.pk, self.post.image.name, touch=False)
+        variant = ImageVariant.objects.get(
+            source=self.post.image.name, format=ImageVariant.JPEG)
+        self.assertEqual(variant.size, variant.file.size)
+        post = Post.objects.get(pk=self.post.pk)
+        thumbnails.attach_urls([post])
+        self.assertEqual(
+            post.image_srcset['jpeg'], f'{variant.file.url} {variant.width}w')
+
+    def test_missing_variants_are_not_cached(self):
+        thumbnails.attach_srcsets([self.post])
+        self.assertEqual(self.post.image_srcset, {})
+        self.assertIsNone(
+            cache.get(thumbnails.srcset_key(self.post.image.name)))
+
+    def test_variants_built_twice_keep_one_set_of_files(self):
+        name = self.post.image.name
+        first = thumbnails.render_variants(name, inline=True)
+        second = thumbnails.render_variants(name, inline=True)
+        thumbnails.store_variants(name, first)
+        thumbnails.store_variants(name, second)
+        self.assertEqual(
+            sorted(ImageVariant.objects.values_list('file', flat=True)),
+            sorted(variant.file.name for variant in first))
+        for variant in second:
+            self.assertFalse(variant.file.storage.exists(variant.file.name))
+
+
+class RegenerateThumbnailsTests(TempMediaTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.checkpoint = os.path.join(cls.media_root, 'checkpoint.json')
+
+    def setUp(self):
+        cache.clear()
+        # Созданные через ORM посты ещё без миниатюр: как будто размеры
+        # в шаблонах только что поменялись.
+        self.posts = [
+            Post.objects.create(
+                text='Пост', author=self.author,
+                image=SimpleUploadedFile(
+                    f'{i}.gif', small_gif(i), 'image/gif'))
+            for i in range(3)
+        ]
+
+    def regenerate(self, *args):
+        out = StringIO()
+        call_command(
+            'regenerate_thumbnails', *args, '--processes=0',
+            '--chunk-size=2', f'--checkpoint={self.checkpoint}',
+            stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_regenerates_in_chunks(self):
+        out = self.regenerate()
+        self.assertIn('2/3', out)
+        self.assertIn('Готово: 3 картинок, ошибок: 0', out)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        for post in Post.objects.all():
+            self.assertIsNotNone(
+                thumbnails.ready_thumbnail(post.image, 'card'))
+            self.assertTrue(
+                ImageVariant.objects.filter(source=post.image.name).exists())
+            self.assertEqual(post.version, 1)
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({
+                'last_pk': self.posts[0].pk, 'done': 1, 'failed': [],
+                'sizes': regenerate_thumbnails._sizes_signature(),
+            }, checkpoint)
+        out = self.regenerate('--resume')
+        self.assertIn('3/3', out)
+        self.assertIsNone(
+            thumbnails.ready_thumbnail(self.posts[0].image, 'card'))
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.posts[2].image, 'card'))
+
+    def test_failed_posts_are_retried_on_resume(self):
+        broken = self.posts[0].image.name
+        render = thumbnails.render
+
+        def failing_render(name, variants=False):
+            if name == broken:
+                raise OSError('битый файл')
+            return render(name, variants)
+
+        with mock.patch.object(thumbnails, 'render', failing_render):
+            out = self.regenerate()
+        self.assertIn('Готово: 2 картинок, ошибок: 1', out)
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(
+                json.load(checkpoint)['failed'], [self.posts[0].pk])
+        self.assertIsNone(
+            thumbnails.ready_thumbnail(self.posts[0].image, 'card'))
+        out = self.regenerate('--resume')
+        self.assertIn('Готово: 3 картинок, ошибок: 0', out)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.posts[0].image, 'card'))
+
+    def test_pool_does_not_write_to_db(self):
+        self.addCleanup(
+            setattr, default.kvstore, '_wrapped', default.kvstore._wrapped)
+        thumbnails.init_render_process()
+        keys = KVStore.objects.count()
+        variants = thumbnails.render(self.posts[0].image.name, variants=True)
+        self.assertTrue(variants)
+        self.assertEqual(KVStore.objects.count(), keys)
+        self.assertFalse(ImageVariant.objects.exists())
+
+
+class ImageBlobTests(TempMediaTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, content=SMALL_GIF):
+        return Post.objects.create(
+            text='Пост', author=self.author,
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'))
+
+    def test_shared_file_is_counted_and_deleted_with_last_post(self):
+        first, second = self.create_post(), self.create_post()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        thumbnails.generate(first.pk, name, touch=False)
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        with mock.patch('django.db.transaction.on_commit', lambda f: f()):
+            first.delete()
+            self.assertTrue(first.image.storage.exists(name))
+            second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(first.image.storage.exists(name))
+        self.assertFalse(ImageVariant.objects.filter(source=name).exists())
+
+    def test_file_lost_before_acquire_is_rewritten(self):
+        """Файл, удалённый между save() хранилища и записью ссылки,
+        записывается заново.
+        """
+        name = self.create_post().image.name
+        storage = blobs.storage()
+        save = type(storage).save
+
+        def save_then_lose(self, *args, **kwargs):
+            saved = save(self, *args, **kwargs)
+            self.delete(saved)
+            return saved
+
+        with mock.patch.object(type(storage), 'save', save_then_lose):
+            post = self.create_post()
+        self.assertEqual(post.image.name, name)
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), SMALL_GIF)
+        blob = ImageBlob.objects.get(name=name)
+        self.assertEqual((blob.references, blob.size), (2, len(SMALL_GIF)))
+
+    def test_replaced_image_releases_old_file(self):
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF + b'!')
+        post.save()
+        self.assertEqual(
+            dict(ImageBlob.objects.values_list('name', 'references')),
+            {old_name: 0, post.image.name: 1})
+
+    def test_dedupe_images_adopts_legacy_files_and_reports(self):
+        post = self.create_post()
+        legacy = post.image.storage.path('posts/legacy.gif')
+        with open(legacy, 'wb') as file:
+            file.write(SMALL_GIF)
+        Post.objects.filter(pk=post.pk).update(image='posts/legacy.gif')
+        ImageBlob.objects.update(references=0)
+        self.create_post()
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(is_content_name(post.image.name))
+        self.assertEqual(ImageBlob.objects.get().references, 2)
+        self.assertIn('Перенесено картинок: 1', out.getvalue())
+        self.assertIn(f'оригиналы {len(SMALL_GIF)}', out.getvalue())
+
+
+class CollectMediaTests(TempMediaTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост', author=self.author,
+            image=SimpleUploadedFile('kept.gif', small_gif('kept')))
+        thumbnails.generate(self.post.pk, self.post.image.name, touch=False)
+        # Картинка, которую заменили правкой поста.
+        self.storage = self.post.image.storage
+        self.orphan = 'posts/replaced.gif'
+        with open(self.storage.path(self.orphan), 'wb') as file:
+            file.write(small_gif('replaced'))
+        thumbnails.generate(0, self.orphan, touch=False)
+        self.orphan_thumbnail = card_thumbnail(self.orphan)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command(
+            'collect_media', '--rate=0', '--workers=2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_are_deleted(self):
+        out = self.collect('--min-age=0')
+        self.assertIn('Оригиналы: файлов 2, удалено 1', out)
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(self.storage.exists(self.orphan_thumbnail))
+        self.assertFalse(
+            ImageVariant.objects.filter(source=self.orphan).exists())
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        kept = ImageVariant.objects.filter(source=self.post.image.name)
+        self.assertTrue(kept.exists())
+        for variant in kept:
+            self.assertTrue(self.storage.exists(variant.file.name))
+        self.assertTrue(self.storage.exists(
+            card_thumbnail(self.post.image.name)))
+
+    def test_references_are_rechecked_before_each_delete(self):
+        """Ссылка, появившаяся после проверки порции, спасает файл."""
+        with mock.patch.object(
+                collect_media, '_referenced_originals', lambda names: set()):
+            out = self.collect('--min-age=0')
+        self.assertIn('Оригиналы: файлов 2, удалено 1', out)
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        self.assertEqual(
+            ImageBlob.objects.get(name=self.post.image.name).references, 1)
+
+    def test_touched_file_is_kept(self):
+        """Файл, который после сканирования переиспользовала загрузка,
+        не удаляется.
+        """
+        past = time.time() - 7200
+        os.utime(self.storage.path(self.orphan), (past, past))
+        scan = collect_media.Command.scan
+
+        def scan_then_touch(command):
+            files = scan(command)
+            os.utime(self.storage.path(self.orphan))
+            return files
+
+        with mock.patch.object(collect_media.Command, 'scan', scan_then_touch):
+            out = self.collect('--min-age=3600')
+        self.assertIn('Оригиналы: файлов 1, удалено 0', out)
+        self.assertTrue(self.storage.exists(self.orphan))
+
+    def test_dry_run_only_lists(self):
+        out = self.collect('--min-age=0', '--dry-run')
+        self.assertIn(self.orphan, out)
+        self.assertTrue(self.storage.exists(self.orphan))
+
+    def test_fresh_files_are_kept(self):
+        """Свежий файл может ждать записи ссылки в базу."""
+        self.collect()
+        self.assertTrue(self.storage.exists(self.orphan))
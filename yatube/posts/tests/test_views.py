@@ -1,20 +1,28 @@
-import shutil
-import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
-from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
 
-from posts.models import Comment, Follow, Group, Post, User
+from posts import feed_cache, fulltext
+from posts.fragments import render_cards
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.page_cache import cached_page
+from posts.paginators import CursorPaginator, elided_page_range
+from posts.tests.utils import TempMediaTestCase
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
-
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostPagesTests(TestCase):
+class PostPagesTests(TempMediaTestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -50,11 +58,6 @@ class PostPagesTests(TestCase):
             image=uploaded
         )
 
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
-        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
-
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.authorized_user)
@@ -189,18 +192,77 @@ class PostPagesTests(TestCase):
         self.assertEqual(Comment.objects.first().text, form['text'])
 
     def test_index_cache(self):
-        """Проверка хранения и очищения кэша для index."""
+        """Страница index берётся из кэша, пока лента не изменилась."""
         self.assertNotEqual(Post.objects.count(), 0)
         initial_response = self.authorized_client.get(reverse('posts:index'))
-        initial_content = initial_response.content
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.authorized_client.get(
+                reverse('posts:index'))
+        self.assertEqual(cached_response.content, initial_response.content)
+        self.assertFalse(
+            [q for q in queries if 'posts_post' in q['sql']])
         Post.objects.get(pk=1).delete()
-        new_response = self.authorized_client.get(reverse('posts:index'))
-        cached_content = new_response.content
-        self.assertEqual(cached_content, initial_content)
-        cache.clear()
         updated_response = self.authorized_client.get(reverse('posts:index'))
-        real_content = updated_response.content
-        self.assertNotEqual(real_content, cached_content)
+        self.assertNotEqual(
+            updated_response.content, initial_response.content)
+
+    def test_index_cache_is_per_page(self):
+        """Разные страницы index кэшируются отдельно."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user_author)
+            for i in range(10))
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(
+            reverse('posts:index') + '?page=2')
+        self.assertEqual(second.context['page_obj'].number, 2)
+        self.assertFalse(
+            set(first.context['page_obj']) & set(second.context['page_obj']))
+
+    def test_post_cards_are_cached(self):
+        """Карточки постов рендерятся один раз на версию поста."""
+        self.authorized_client.get(reverse('posts:group_list',
+                                           args=[self.group.slug]))
+        with mock.patch('posts.fragments.render_to_string') as render:
+            response = self.authorized_client.get(reverse('posts:index'))
+        render.assert_not_called()
+        self.assertContains(response, self.post.text)
+
+    def test_post_card_changes_after_edit(self):
+        self.authorized_client.get(reverse('posts:index'))
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированный пост'
+        post.save(update_fields=['text'])
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Отредактированный пост')
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).version, self.post.version + 1)
+
+    def test_saving_same_instance_twice(self):
+        """Каждое сохранение одного экземпляра даёт новую версию."""
+        post = Post.objects.get(pk=self.post.pk)
+        stale = Post.objects.get(pk=self.post.pk)
+        post.text = 'Первая правка'
+        post.save()
+        self.authorized_client.get(reverse('posts:index'))
+        post.text = 'Вторая правка'
+        post.save()
+        self.assertEqual(post.version, self.post.version + 2)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Вторая правка')
+        # Экземпляр, загруженный до обеих правок, не откатывает версию.
+        stale.save()
+        self.assertEqual(stale.version, self.post.version + 3)
+
+    def test_post_card_changes_after_author_rename(self):
+        def card():
+            post = Post.objects.select_related('author').get(pk=self.post.pk)
+            return render_cards([post])[0]
+
+        card()
+        self.user_author.first_name = 'Новое'
+        self.user_author.last_name = 'Имя'
+        self.user_author.save()
+        self.assertIn('Новое Имя', card())
 
     def test_new_posts_in_feed_after_subscription(self):
         response = self.authorized_client.get(reverse('posts:follow_index'))
@@ -306,3 +368,550 @@ class PaginatorViewsTest(TestCase):
         for post in posts:
             with self.subTest(post=post):
                 self.assertNotEqual(post, self.all_posts[0])
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсорные ссылки обходят ленту без пропусков и повторов."""
+        pages_to_test = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug_1'}),
+            reverse('posts:profile', kwargs={'username': 'Auth'})
+        ]
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        for value in pages_to_test:
+            with self.subTest(value=value):
+                first_page = self.client.get(value).context['page_obj']
+                cursor = first_page.older_cursor
+                self.assertIsNotNone(cursor)
+                response = self.client.get(value, {'before': cursor})
+                older_page = response.context['page_obj']
+                self.assertTrue(older_page.is_cursor)
+                self.assertEqual(
+                    list(first_page) + list(older_page), expected)
+                self.assertFalse(older_page.has_next())
+                response = self.client.get(
+                    value, {'after': older_page.newer_cursor})
+                self.assertEqual(
+                    list(response.context['page_obj']), expected[:10])
+
+    def test_cursor_page_does_not_count(self):
+        cursor = self.client.get(
+            reverse('posts:index')).context['page_obj'].older_cursor
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('posts:index'), {'before': cursor})
+        for query in context.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'before': 'broken'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_feed_count_is_cached(self):
+        self.client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('posts:group_list', kwargs={'slug': 'test-slug_1'}))
+            response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        counts = [query['sql'] for query in context.captured_queries
+                  if query['sql'].startswith('SELECT COUNT(*)')]
+        self.assertEqual(len(counts), 1)
+
+    @mock.patch('posts.paginators.EXACT_COUNT_LIMIT', 11)
+    def test_large_feed_count_is_bounded(self):
+        """Большие выборки не считаются целиком."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        # Дальше предела — оценка по всей таблице, а не сам предел.
+        self.assertEqual(page_obj.paginator.count, 13)
+        self.assertEqual(len(page_obj), 10)
+        self.assertTrue(page_obj.has_next())
+        count_sql = next(query['sql'] for query in context.captured_queries
+                         if query['sql'].startswith('SELECT COUNT(*)'))
+        self.assertIn('LIMIT 12', count_sql)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Auth')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.old_post = Post.objects.create(text='Старый пост',
+                                           author=cls.author)
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        cache.clear()
+
+    def feed(self):
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follows_subscriptions_and_posts(self):
+        """Лента пополняется при подписке и публикации, чистится при
+        отписке и удалении поста."""
+        self.follower_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'Auth'}))
+        self.assertEqual(self.feed(), [self.old_post])
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        new_post.delete()
+        self.assertEqual(self.feed(), [self.old_post])
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'Auth'}))
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_rebuild_timeline_command(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timeline', 'Follower', stdout=StringIO())
+        self.assertEqual(self.feed(), [self.old_post])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_celebrity_posts_are_pulled(self):
+        """Посты автора с множеством подписчиков подмешиваются при чтении."""
+        celebrity = User.objects.create_user(username='Celebrity')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=self.follower, author=celebrity)
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response['X-Feed-Path'], 'push')
+        Follow.objects.create(user=fan, author=celebrity)
+        Follow.objects.create(user=self.follower, author=self.author)
+        celebrity_post = Post.objects.create(text='Пост', author=celebrity)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=celebrity).exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response['X-Feed-Path'], 'hybrid')
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [celebrity_post, self.old_post])
+        Follow.objects.filter(user=fan).delete()
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response['X-Feed-Path'], 'push')
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [celebrity_post, self.old_post])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_skipped_threshold_still_promotes(self):
+        """Автор становится «знаменитостью», даже если счётчик
+        перескочил точное значение порога.
+        """
+        celebrity = User.objects.create_user(username='Celebrity')
+        fans = [
+            User.objects.create_user(username=f'Fan{i}') for i in range(2)]
+        Follow.objects.create(user=self.follower, author=celebrity)
+        post = Post.objects.create(text='Пост', author=celebrity)
+        # Две подписки «одновременно»: обработчики видят уже 3.
+        with mock.patch('posts.timeline.follow_added'):
+            for fan in fans:
+                Follow.objects.create(user=fan, author=celebrity)
+        Follow.objects.create(
+            user=User.objects.create_user(username='Late'), author=celebrity)
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=celebrity).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_threshold_change_reclassifies_authors(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(self.feed(), [self.old_post])
+        with override_settings(FEED_CELEBRITY_THRESHOLD=1):
+            self.assertEqual(self.feed(), [self.old_post])
+            self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [self.old_post])
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_celebrities_are_read_in_one_query(self):
+        """Посты всех «знаменитостей» читаются одним запросом, а по
+        номеру доступна только первая страница ленты.
+        """
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.follower_client.get(
+                    reverse('posts:follow_index'), {'page': 2})
+            return len(context)
+
+        Follow.objects.create(user=self.follower, author=self.author)
+        one = count_queries()
+        for i in range(3):
+            author = User.objects.create_user(username=f'Celebrity{i}')
+            Follow.objects.create(user=self.follower, author=author)
+            Post.objects.create(text='Пост', author=author)
+        self.assertEqual(count_queries(), one)
+        response = self.follower_client.get(
+            reverse('posts:follow_index'), {'page': 2})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(len(page_obj), 4)
+        self.assertEqual(page_obj.paginator.number_pages, 1)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Pushkin')
+        cls.group = Group.objects.create(
+            title='Поэзия', slug='poetry', description='Стихи')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, after=None):
+        params = {'q': query}
+        if after:
+            params['after'] = after
+        response = self.client.get(reverse('posts:search'), params)
+        return response.context['page_obj']
+
+    def test_ranked_by_relevance(self):
+        """Совпадение в имени автора весит больше, чем в тексте."""
+        other = User.objects.create_user(username='Reader')
+        in_text = Post.objects.create(text='Читаю Пушкина', author=other)
+        by_author = Post.objects.create(text='Мороз и солнце',
+                                        author=self.author)
+        self.assertEqual(list(self.search('pushkin')), [by_author])
+        self.assertEqual(list(self.search('пушкин')), [in_text])
+        self.assertEqual(list(self.search('мороз pushk')), [by_author])
+
+    def test_index_follows_changes(self):
+        post = Post.objects.create(text='Мороз и солнце', author=self.author)
+        post.text = 'День чудесный'
+        post.group = self.group
+        post.save()
+        self.assertEqual(list(self.search('мороз')), [])
+        self.assertEqual(list(self.search('чудесный')), [post])
+        self.group.title = 'Лирика'
+        self.group.save()
+        self.assertEqual(list(self.search('лирика')), [post])
+        post.delete()
+        self.assertEqual(list(self.search('чудесный')), [])
+
+    def test_cursor_pagination(self):
+        posts = {
+            Post.objects.create(text=f'Стихи номер {i}', author=self.author)
+            for i in range(13)
+        }
+        first = self.search('стихи')
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first.has_next())
+        second = self.search('стихи', first.older_cursor)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertEqual(set(first) | set(second), posts)
+
+    def test_cursor_survives_new_posts(self):
+        """Новые посты меняют оценки bm25, но не сдвигают следующие
+        страницы уже открытого поиска.
+        """
+        posts = {
+            Post.objects.create(
+                text='Стихи ' + 'слово ' * i, author=self.author)
+            for i in range(13)
+        }
+        first = self.search('стихи')
+        for i in range(5):
+            Post.objects.create(text='Стихи стихи стихи', author=self.author)
+        second = self.search('стихи', first.older_cursor)
+        self.assertEqual(len(second), 3)
+        self.assertEqual(set(first) | set(second), posts)
+
+    def test_first_pages_share_snapshot(self):
+        Post.objects.create(text='Стихи', author=self.author)
+        self.search('стихи')
+        with mock.patch.object(cache, 'set') as cache_set:
+            self.search('стихи')
+        cache_set.assert_not_called()
+
+    def test_expired_cursor_is_rejected(self):
+        Post.objects.create(text='Стихи', author=self.author)
+        self.search('стихи')
+        snapshots = [fulltext.current_snapshot() - 100,
+                     fulltext.current_snapshot() + 1]
+        for snapshot in snapshots:
+            with self.subTest(snapshot=snapshot):
+                with mock.patch.object(fulltext, 'ranked_ids') as ranked:
+                    page = self.search(
+                        'стихи', fulltext.encode_cursor(snapshot, 10))
+                ranked.assert_not_called()
+                self.assertEqual(len(page), 1)
+
+    @mock.patch('posts.fulltext.available', return_value=False)
+    def test_fallback_is_paginated(self, available):
+        posts = {
+            Post.objects.create(text=f'Стихи номер {i}', author=self.author)
+            for i in range(13)
+        }
+        first = self.search('Стихи')
+        self.assertEqual(len(first), 10)
+        second = self.search('Стихи', first.older_cursor)
+        self.assertEqual(set(first) | set(second), posts)
+
+    def test_query_syntax_is_not_passed_to_fts(self):
+        Post.objects.create(text='Мороз и солнце', author=self.author)
+        self.assertEqual(len(self.search('"мороз" (солнц*')), 1)
+        self.assertEqual(list(self.search('***')), [])
+
+    def test_rebuild_search_index_command(self):
+        post = Post.objects.create(text='Мороз и солнце', author=self.author)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        self.assertEqual(list(self.search('мороз')), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('В индексе постов: 1', out.getvalue())
+        self.assertEqual(list(self.search('мороз')), [post])
+
+
+class ElidedPageRangeTests(TestCase):
+    def test_window_around_current_page(self):
+        self.assertEqual(elided_page_range(1, 4), [1, 2, 3, 4])
+        self.assertEqual(
+            elided_page_range(1, 50), [1, 2, 3, None, 50])
+        self.assertEqual(
+            elided_page_range(25, 50),
+            [1, None, 23, 24, 25, 26, 27, None, 50])
+        self.assertEqual(
+            elided_page_range(50, 50), [1, None, 48, 49, 50])
+
+    def test_number_limit_is_not_shown_as_last_page(self):
+        """Предел нумерации не выдаётся за последнюю страницу."""
+        self.assertEqual(
+            elided_page_range(1, 5, truncated=True), [1, 2, 3, None])
+        self.assertEqual(
+            elided_page_range(5, 5, truncated=True),
+            [1, 2, 3, 4, 5, None])
+        paginator = CursorPaginator(Post.objects.none(), 10, count=1000)
+        posts = [Post(pk=i, pub_date=timezone.now()) for i in range(10)]
+        page_obj = paginator._get_page(posts, 1, paginator)
+        self.assertEqual(page_obj.elided_page_range[-1], None)
+        html = render_to_string(
+            'posts/includes/paginator.html', {'page_obj': page_obj})
+        self.assertNotIn('?page=100', html)
+        self.assertNotIn('Последняя', html)
+
+    def test_rendered_links_do_not_depend_on_page_count(self):
+        """Число ссылок в навигации не растёт вместе с числом страниц."""
+        sizes = set()
+        for count in (10 ** 4, 10 ** 7):
+            paginator = CursorPaginator(
+                Post.objects.none(), 10, count=count)
+            posts = [Post(pk=i, pub_date=timezone.now()) for i in range(10)]
+            page_obj = paginator._get_page(posts, 3, paginator)
+            html = render_to_string(
+                'posts/includes/paginator.html', {'page_obj': page_obj})
+            sizes.add(html.count('<li'))
+        self.assertEqual(len(sizes), 1)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_not_modified_without_rendering(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with mock.patch('posts.views.render') as render:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                render.assert_not_called()
+
+    def test_etag_changes_with_content(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(post=self.post, author=self.reader, text='!')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        """Гость и вошедший пользователь получают разные ETag."""
+        url = reverse('posts:index')
+        self.assertNotEqual(
+            self.client.get(url)['ETag'], self.reader_client.get(url)['ETag'])
+
+    def test_follow_page_not_modified(self):
+        url = reverse('posts:follow_index')
+        etag = self.reader_client.get(url)['ETag']
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, self.post.text)
+
+    def test_group_change_changes_post_etag(self):
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(
+            text='Пост', author=self.author, group=group)
+        url = reverse('posts:post_detail', args=[post.pk])
+        etag = self.client.get(url)['ETag']
+        group.slug = 'renamed'
+        group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Группа: renamed')
+
+    def test_follow_changes_profile_etag(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Отписаться')
+
+    def test_last_modified_only_for_guests(self):
+        url = reverse('posts:index')
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        with mock.patch('time.time', return_value=time.time() + 5):
+            guest = self.client.get(url)
+            reader = self.reader_client.get(url)
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=guest['Last-Modified'])
+        self.assertNotIn('Last-Modified', reader)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_group_is_not_found(self):
+        response = self.client.get(
+            reverse('posts:group_list', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_shell_is_shared(self):
+        """Разметку, отрендеренную для читателя, получает и гость,
+        но с собственной шапкой и без формы комментария.
+        """
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Пользователь: Reader')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        with mock.patch('posts.views.render') as render:
+            response = self.client.get(url)
+        render.assert_not_called()
+        self.assertContains(response, self.post.text)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Reader')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+    def test_previous_version_while_recomputed(self):
+        """Пока новую версию считает другой запрос, читатель получает
+        прошлую и без ETag, а автор правки — уже новую.
+        """
+        url = reverse('posts:index')
+        self.client.get(url)
+        author_client = Client()
+        author_client.force_login(self.author)
+        author_client.post(reverse('posts:post_create'), {'text': 'Новый'})
+        with mock.patch.object(cache, 'add', return_value=False):
+            response = self.client.get(url)
+            own = author_client.get(url)
+        self.assertNotContains(response, 'Новый')
+        self.assertNotIn('ETag', response)
+        self.assertContains(own, 'Новый')
+
+    def test_follow_button_is_per_user(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertContains(self.client.get(url), 'Подписаться')
+        self.assertContains(self.reader_client.get(url), 'Отписаться')
+
+    def test_edit_button_only_for_author(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        author_client = Client()
+        author_client.force_login(self.author)
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        self.assertContains(author_client.get(url), edit_url)
+        self.assertNotContains(self.reader_client.get(url), edit_url)
+
+    def test_extra_query_params_share_cache(self):
+        """Мусор в адресе не заводит новых записей в кэше."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with mock.patch('posts.views.render') as render:
+            for params in ({'page': 1, 'utm': 'x'}, {'page': 'abc'},
+                           {'page': '-3'}, {'before': 'broken'}, {'x': 1}):
+                self.client.get(url, params)
+        render.assert_not_called()
+
+    def test_view_headers_are_kept(self):
+        def view(request):
+            response = HttpResponse('Страница')
+            response['X-Robots-Tag'] = 'noindex'
+            return response
+
+        cached = cached_page(lambda request: ['index'])(view)
+        for _ in range(2):
+            request = RequestFactory().get('/')
+            request.user = self.reader
+            response = cached(request)
+            self.assertEqual(response['X-Robots-Tag'], 'noindex')
+            self.assertEqual(response.content.decode(), 'Страница')
+
+    def test_author_rename_updates_cached_pages(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=['Author']),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        )
+        api_url = reverse('posts:api_post_detail', args=[self.post.pk])
+        etag = self.client.get(api_url)['ETag']
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Author')
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'Renamed'
+        author.save()
+        self.assertContains(
+            self.client.get(reverse('posts:profile', args=['Renamed'])),
+            'Renamed')
+        for url in urls[::2]:
+            self.assertContains(self.client.get(url), 'Renamed')
+            self.assertNotContains(self.client.get(url), 'Author')
+        response = self.client.get(api_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['post']['author'], 'Renamed')
+
+    def test_rename_does_not_bump_each_post(self):
+        version = feed_cache.feed_version(f'post:{self.post.pk}')
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        self.assertEqual(
+            feed_cache.feed_version(f'post:{self.post.pk}'), version)
+
+    def test_login_does_not_bump_feeds(self):
+        version = feed_cache.feed_version(f'profile:{self.author.pk}')
+        self.client.force_login(self.author)
+        self.assertEqual(
+            feed_cache.feed_version(f'profile:{self.author.pk}'), version)
@@ -0,0 +1,33 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+
+class TempMediaTestCase(TestCase):
+    """TestCase со своим MEDIA_ROOT во временном каталоге вне проекта.
+
+    Каталог заводится на класс и удаляется после него, так что файлы
+    одних тестов не видны другим при любом порядке запуска.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.remove_media()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.remove_media()
+
+    @classmethod
+    def remove_media(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
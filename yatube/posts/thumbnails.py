@@ -0,0 +1,358 @@
+"""Миниатюры картинок постов, которые готовятся заранее в фоне.
+
+Шаблоны берут миниатюру только если её адрес уже записан в кэш
+(THUMBNAIL_KEY), а до этого показывают оригинал. Генерация идёт в пуле
+потоков из THUMBNAIL_WORKERS; при нуле — сразу в текущем потоке.
+Там же строятся копии для srcset (ImageVariant): ресайз и кодирование
+уходят в пул процессов из IMAGE_PROCESSES.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import F
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import KVStoreBase
+
+from core import imaging
+from core.middleware import outside_budget
+
+from . import feed_cache
+from .models import ImageVariant, Post
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, которые выводят шаблоны.
+SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Ширина картинки на странице для атрибута sizes.
+SRCSET_SIZES = '(max-width: 960px) 100vw, 960px'
+SRCSET_KEY = 'image:srcset:{}'
+# Адреса готовых миниатюр: по ним шаблоны узнают, что генерировать
+# уже нечего. Выпавший из кэша адрес вернёт очередь — у sorl миниатюра
+# к тому времени уже есть, так что это дёшево.
+THUMBNAIL_KEY = 'image:thumbnail:{}:{}'
+SRCSET_TIMEOUT: int = 60 * 60 * 24
+# Пока копии считаются, другие запросы и процессы их не начинают.
+VARIANTS_LEASE_KEY = 'image:variants:lease:{}'
+VARIANTS_LEASE_TIMEOUT = 60
+EXTENSIONS = {ImageVariant.WEBP: 'webp', ImageVariant.JPEG: 'jpg'}
+
+_executor = None
+_processes = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def source_file(name):
+    """Исходник по имени в хранилище поля Post.image: от хранилища
+    зависят ключи sorl, а с ними и имена миниатюр.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def thumbnail_key(name, size):
+    return THUMBNAIL_KEY.format(md5(name.encode()).hexdigest(), size)
+
+
+def ready_thumbnail(image, size):
+    """Адрес готовой миниатюры или None; сама ничего не генерирует."""
+    return cache.get(thumbnail_key(image.name, size))
+
+
+def make_thumbnails(name):
+    """Миниатюры всех размеров: {размер: адрес}."""
+    return {
+        size: get_thumbnail(source_file(name), geometry, **options).url
+        for size, (geometry, options) in SIZES.items()
+    }
+
+
+def remember_thumbnails(name, urls):
+    cache.set_many(
+        {thumbnail_key(name, size): url for size, url in urls.items()}, None)
+
+
+def touch_post(post_id, name):
+    """Сдвигает версии поста и его лент, если картинка у него та же:
+    иначе страницы и их ETag так и отдавали бы оригинал. Сохранение
+    поста тут не годится — оно заново индексирует его для поиска.
+    """
+    post = Post.objects.filter(pk=post_id, image=name).values_list(
+        'author_id', 'group_id').first()
+    if post is None:
+        return
+    author_id, group_id = post
+    Post.objects.filter(pk=post_id).update(version=F('version') + 1)
+    feeds = ['index', f'profile:{author_id}', f'post:{post_id}']
+    if group_id:
+        feeds.append(f'group:{group_id}')
+    feed_cache.bump(*feeds)
+
+
+def generate(post_id, name, touch):
+    try:
+        remember_thumbnails(name, make_thumbnails(name))
+        build_variants(name)
+        if touch:
+            touch_post(post_id, name)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры для %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def in_process_pool(func, *args):
+    global _processes
+    if not settings.IMAGE_PROCESSES:
+        return func(*args)
+    with _lock:
+        if _processes is None:
+            # Пул создаётся из потока пула миниатюр: fork копировал бы
+            # захваченные другими потоками блокировки.
+            _processes = ProcessPoolExecutor(
+                settings.IMAGE_PROCESSES,
+                mp_context=multiprocessing.get_context('forkserver'))
+    return _processes.submit(func, *args).result()
+
+
+def card_ratio():
+    width, height = SIZES['card'][0].split('x')
+    return int(width) / int(height)
+
+
+def build_variants(name, inline=False):
+    """Сохраняет копии картинки name для srcset, если их ещё нет.
+
+    inline — считать в текущем процессе, когда он сам работает в пуле.
+    """
+    if ImageVariant.objects.filter(source=name).exists():
+        return
+    lease_key = VARIANTS_LEASE_KEY.format(md5(name.encode()).hexdigest())
+    if not cache.add(lease_key, 1, VARIANTS_LEASE_TIMEOUT):
+        return
+    try:
+        store_variants(name, render_variants(name, inline))
+    finally:
+        cache.delete(lease_key)
+
+
+def render_variants(name, inline=False):
+    """Считает копии картинки name и сохраняет их файлы; строки
+    ImageVariant возвращаются несохранёнными, в БД ничего не пишется.
+    """
+    with default_storage.open(name) as image:
+        data = image.read()
+    if inline:
+        rendered = imaging.render_variants(data, card_ratio())
+    else:
+        rendered = in_process_pool(
+            imaging.render_variants, data, card_ratio())
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = [
+        ImageVariant(
+            source=name, format=image_format, width=width, height=height,
+            file=default_storage.save(
+                f'posts/variants/{stem}-{width}.{EXTENSIONS[image_format]}',
+                ContentFile(content)),
+            size=len(content), processing_ms=processing_ms)
+        for image_format, width, height, content, processing_ms in rendered
+    ]
+    logger.info(
+        '%s: %d копий, %d из %d байт, %.1f мс', name, len(variants),
+        sum(variant.size for variant in variants), len(data),
+        sum(variant.processing_ms for variant in variants))
+    return variants
+
+
+def store_variants(name, variants):
+    """Записывает строки копий; файлы копий, чьи строки уже успел
+    записать кто-то другой, удаляются.
+    """
+    ImageVariant.objects.bulk_create(variants, ignore_conflicts=True)
+    stored = set(ImageVariant.objects.filter(source=name).values_list(
+        'file', flat=True))
+    for variant in variants:
+        if variant.file.name not in stored:
+            default_storage.delete(variant.file.name)
+    cache.delete(srcset_key(name))
+
+
+def delete_variants(name):
+    """Удаляет копии картинки name вместе с файлами."""
+    variants = ImageVariant.objects.filter(source=name)
+    for file in variants.values_list('file', flat=True):
+        default_storage.delete(file)
+    variants.delete()
+    cache.delete(srcset_key(name))
+
+
+def delete_derived(name):
+    """Удаляет миниатюры и копии картинки name; сам файл остаётся.
+
+    Миниатюры старых картинок могли быть сделаны с ключом хранилища
+    по умолчанию, поэтому чистятся оба ключа.
+    """
+    delete(source_file(name), delete_file=False)
+    delete(ImageFile(name, default_storage), delete_file=False)
+    cache.delete_many([thumbnail_key(name, size) for size in SIZES])
+    delete_variants(name)
+
+
+class MemoryKVStore(KVStoreBase):
+    """Хранилище ключей sorl в памяти процесса: в процессах пула
+    regenerate_thumbnails миниатюры только рисуются, а в БД их
+    записывает основной процесс.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def _get_raw(self, key):
+        return self.data.get(key)
+
+    def _set_raw(self, key, value):
+        self.data[key] = value
+
+    def _delete_raw(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def _find_keys_raw(self, prefix):
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+def init_render_process():
+    """initializer пула процессов для render: SQLite не любит
+    записи из нескольких процессов сразу.
+    """
+    default.kvstore._wrapped = MemoryKVStore()
+
+
+def render(name, variants=False):
+    """Рисует файлы миниатюр всех размеров и, если variants, копий для
+    srcset прямо в текущем процессе. Возвращает несохранённые строки
+    ImageVariant для store.
+    """
+    make_thumbnails(name)
+    return render_variants(name, inline=True) if variants else []
+
+
+def store(name, variants, replace=False):
+    """Записывает в БД то, что нарисовал render: файлы миниатюр уже
+    в хранилище, так что sorl только добавит ключи. replace — сначала
+    удалить прежние копии для srcset.
+    """
+    remember_thumbnails(name, make_thumbnails(name))
+    if replace:
+        delete_variants(name)
+    if variants:
+        store_variants(name, variants)
+
+
+def generate_in_worker(post_id, name):
+    try:
+        generate(post_id, name, touch=True)
+    finally:
+        # У потока пула свои соединения с БД, держать их незачем.
+        connections.close_all()
+
+
+def enqueue(post):
+    """Ставит в очередь миниатюры всех размеров для картинки поста."""
+    global _executor
+    name = post.image.name
+    if not name:
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if settings.THUMBNAIL_WORKERS and _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.THUMBNAIL_WORKERS, 'thumbnails')
+    if not settings.THUMBNAIL_WORKERS:
+        with outside_budget():
+            generate(post.pk, name, touch=False)
+        return
+    _executor.submit(generate_in_worker, post.pk, name)
+
+
+def attach_urls(posts):
+    """Сохраняет в post.image_urls адреса картинок всех размеров для
+    постов страницы, разом: одним get_many к кэшу. Чего ещё нет (или
+    выпало из кэша), ставится в очередь, а до готовности отдаётся
+    оригинал.
+    """
+    posts = [post for post in posts if post.image]
+    keys = {
+        (post.pk, size): thumbnail_key(post.image.name, size)
+        for post in posts for size in SIZES
+    }
+    ready = cache.get_many(list(keys.values()))
+    for post in posts:
+        post.image_urls = {}
+        for size in SIZES:
+            url = ready.get(keys[post.pk, size])
+            if url is None:
+                url = generate_missing(post, size)
+            post.image_urls[size] = url or post.image.url
+    attach_srcsets(posts)
+
+
+def srcset_key(name):
+    return SRCSET_KEY.format(md5(name.encode()).hexdigest())
+
+
+def attach_srcsets(posts):
+    """post.image_srcset: строка srcset по каждому формату. Берётся
+    из кэша одним get_many, промахи — одним запросом к ImageVariant.
+    """
+    keys = {srcset_key(post.image.name): post.image.name for post in posts}
+    srcsets = cache.get_many(list(keys))
+    missed = {keys[key]: {} for key in keys if key not in srcsets}
+    variants = ImageVariant.objects.filter(
+        source__in=missed).values_list('source', 'format', 'width', 'file')
+    for source, image_format, width, file in variants if missed else ():
+        missed[source].setdefault(image_format, []).append(
+            f'{default_storage.url(file)} {width}w')
+    missed = {
+        srcset_key(source): {
+            image_format: ', '.join(candidates)
+            for image_format, candidates in formats.items()
+        }
+        for source, formats in missed.items()
+    }
+    # Пустой srcset не кэшируется: копии могут появиться через секунду.
+    cache.set_many(
+        {key: srcset for key, srcset in missed.items() if srcset},
+        SRCSET_TIMEOUT)
+    srcsets.update(missed)
+    for post in posts:
+        post.image_srcset = srcsets[srcset_key(post.image.name)]
+
+
+def generate_missing(post, size):
+    enqueue(post)
+    if settings.THUMBNAIL_WORKERS:
+        return None
+    return ready_thumbnail(post.image, size)
+
+
+def image_url(post, size):
+    """Адрес миниатюры, а пока её нет — оригинала."""
+    if not hasattr(post, 'image_urls'):
+        attach_urls([post])
+    return post.image_urls[size]
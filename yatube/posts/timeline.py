@@ -0,0 +1,183 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import counters
+from .models import Follow, Post, TimelineEntry, UserCounter
+from .paginators import CursorPaginator, MergedPaginator, TimelinePaginator
+
+BATCH_SIZE: int = 500
+CELEBRITIES_KEY = 'timeline:celebrities:{}'
+# Последний посчитанный набор без срока: с ним сверяется новый.
+KNOWN_CELEBRITIES_KEY = 'timeline:celebrities:known'
+CELEBRITIES_TIMEOUT: int = 60 * 5
+PATH_KEY = 'timeline:path:{}'
+PATHS = ('push', 'pull', 'hybrid')
+
+
+def _bulk_insert(entries):
+    entries = iter(entries)
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+def celebrity_ids():
+    """Авторы, у которых подписчиков не меньше FEED_CELEBRITY_THRESHOLD.
+
+    Их посты не раскладываются по лентам, а подмешиваются при чтении.
+    Набор живёт CELEBRITIES_TIMEOUT секунд под ключом с порогом, так
+    что пропущенная инвалидация или новый порог исправятся сами.
+    Авторов, перешедших границу с прошлого подсчёта, reclassify()
+    переносит между раздачей и подмешиванием.
+    """
+    threshold = settings.FEED_CELEBRITY_THRESHOLD
+    key = CELEBRITIES_KEY.format(threshold)
+    cached = cache.get_many([key, KNOWN_CELEBRITIES_KEY])
+    ids = cached.get(key)
+    if ids is None:
+        ids = frozenset(
+            UserCounter.objects.filter(
+                followers_count__gte=threshold
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(key, ids, CELEBRITIES_TIMEOUT)
+    known = cached.get(KNOWN_CELEBRITIES_KEY)
+    if known != ids:
+        if known is not None:
+            reclassify(promoted=ids - known, demoted=known - ids)
+        cache.set(KNOWN_CELEBRITIES_KEY, ids, None)
+    return ids
+
+
+def forget_celebrities():
+    cache.delete(CELEBRITIES_KEY.format(settings.FEED_CELEBRITY_THRESHOLD))
+
+
+def reclassify(promoted=(), demoted=()):
+    """Посты новых «знаменитостей» убираются из лент, а бывших —
+    раскладываются по лентам всех их подписчиков.
+    """
+    if promoted:
+        TimelineEntry.objects.filter(author_id__in=promoted).delete()
+    for author_id in demoted:
+        follower_ids = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        for follower_id in follower_ids.iterator():
+            backfill(follower_id, author_id)
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    if post.author_id in celebrity_ids():
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        TimelineEntry(
+            user_id=follower_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        ) for follower_id in follower_ids.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя уже опубликованные посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date')
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ) for post_id, pub_date in posts.iterator()
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+
+
+def follow_added(user_id, author_id):
+    # Сравнение с порогом, а не равенство: параллельные подписки могут
+    # перескочить точное значение.
+    followers = counters.for_user(author_id).followers_count
+    if followers < settings.FEED_CELEBRITY_THRESHOLD:
+        backfill(user_id, author_id)
+    elif author_id not in celebrity_ids():
+        forget_celebrities()
+        celebrity_ids()
+
+
+def follow_removed(user_id, author_id):
+    trim(user_id, author_id)
+    followers = counters.for_user(author_id).followers_count
+    if (followers < settings.FEED_CELEBRITY_THRESHOLD
+            and author_id in celebrity_ids()):
+        forget_celebrities()
+        celebrity_ids()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля по текущим подпискам."""
+    author_ids = Follow.objects.filter(
+        user_id=user_id).exclude(
+        author_id__in=celebrity_ids()).values_list('author_id', flat=True)
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        for author_id in author_ids:
+            backfill(user_id, author_id)
+
+
+def feed_paginator(user, per_page):
+    """Возвращает (paginator, путь) для ленты подписок пользователя.
+
+    push: только материализованная лента; pull: только посты
+    «знаменитостей»; hybrid: оба источника, слитые по pub_date.
+    По номеру доступна только первая страница, дальше — курсоры.
+    """
+    counters = list(UserCounter.objects.filter(
+        user__following__user=user, user_id__in=celebrity_ids()))
+    # Записи автора, ставшего «знаменитостью» до сверки, не дублируют
+    # его посты, подмешанные при чтении.
+    pushed = TimelinePaginator(
+        user.timeline.exclude(
+            author_id__in=[counter.user_id for counter in counters]),
+        per_page)
+    # Посты всех «знаменитостей» — один источник и один запрос.
+    pulled = CursorPaginator(
+        Post.objects.filter(author_id__in=[
+            counter.user_id for counter in counters
+        ]).select_related('author', 'group'),
+        per_page,
+        count=sum(counter.posts_count for counter in counters))
+    pushed.cursor_only = pulled.cursor_only = True
+    if not counters:
+        path, paginator = 'push', pushed
+    elif not user.timeline.exists():
+        path, paginator = 'pull', pulled
+    else:
+        path = 'hybrid'
+        paginator = MergedPaginator([pushed, pulled], per_page)
+    record_path(path)
+    return paginator, path
+
+
+def record_path(path):
+    key = PATH_KEY.format(path)
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def path_stats():
+    return {
+        path: cache.get(PATH_KEY.format(path), 0) for path in PATHS
+    }
@@ -1,30 +1,57 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import counters, feed_cache, fulltext, thumbnails, timeline
+from .conditional import (conditional_feed, feeds, follow_feeds,
+                          group_feeds, index_feeds, post_feeds,
+                          profile_feeds)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Follow, Group, Post, User
+from .page_cache import cached_page
+from .paginators import page_from_request
 
 POSTS_QUANTITY: int = 10
 
 
+# Выборки лент общие для страниц и для JSON API.
+def index_queryset():
+    return Post.objects.select_related('author', 'group')
+
+
+def group_queryset(group):
+    return group.posts.select_related('author')
+
+
+def profile_queryset(user):
+    return user.posts.select_related('group')
+
+
+def post_queryset():
+    return Post.objects.select_related('author', 'group')
+
+
+def comments_queryset(post_id):
+    return Comment.objects.filter(post_id=post_id).select_related('author')
+
+
+@conditional_feed(index_feeds)
+@cached_page(index_feeds)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_QUANTITY)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = feed_cache.cached_paginate(
+        request, 'index', index_queryset(), POSTS_QUANTITY)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_feed(group_feeds)
+@cached_page(group_feeds)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, POSTS_QUANTITY)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = feed_cache.cached_paginate(
+        request, f'group:{group.pk}', group_queryset(group), POSTS_QUANTITY)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -32,29 +59,42 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_feed(profile_feeds)
+@cached_page(profile_feeds)
 def profile(request, username):
     user_obj = get_object_or_404(User, username=username)
-    users_posts = user_obj.posts.all()
-    posts_number = users_posts.count()
-    paginator = Paginator(users_posts, POSTS_QUANTITY)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = (request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=user_obj).exists())
+    posts_number = counters.for_user(user_obj.pk).posts_count
+    page_obj = feed_cache.cached_paginate(
+        request, f'profile:{user_obj.pk}',
+        profile_queryset(user_obj), POSTS_QUANTITY,
+        count=posts_number)
+    thumbnails.attach_urls(page_obj)
     context = {
         'user_obj': user_obj,
         'posts_number': posts_number,
         'page_obj': page_obj,
-        'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_with_comments(post_id):
+    post = get_object_or_404(post_queryset(), pk=post_id)
+    return post, list(comments_queryset(post_id))
+
+
+@conditional_feed(post_feeds)
+@cached_page(post_feeds)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    author_posts_number = post.author.posts.count()
+    # Копия поста зависит от него самого, имени автора и группы; число
+    # постов автора берётся из счётчика отдельно.
+    versions = feed_cache.feed_versions(*(
+        feed for feed in feeds(request, post_feeds, post_id) or ()
+        if not feed.startswith('profile:')))
+    post, comments = feed_cache.get_or_compute(
+        request, 'post', f'post:detail:{post_id}',
+        lambda: post_with_comments(post_id), versions)
+    author_posts_number = counters.for_user(post.author_id).posts_count
     comment_form = CommentForm()
-    comments = post.comments.select_related('post')
     context = {
         'post': post,
         'author_posts_number': author_posts_number,
@@ -65,12 +105,17 @@ def post_detail(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(
+        request.POST or None, files=request.FILES or None,
+        oversized=getattr(request, 'oversized_uploads', ()))
     if request.method == 'POST' and form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        feed_cache.mark_writer(request)
+        transaction.on_commit(lambda: thumbnails.enqueue(post))
         return redirect('posts:profile', username=request.user)
     context = {
         'is_edit': False,
@@ -87,10 +132,17 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        oversized=getattr(request, 'oversized_uploads', ())
     )
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        # Только поля формы: comments_count меняют сигналы комментариев.
+        post.save(update_fields=form.Meta.fields)
+        form.save_m2m()
+        feed_cache.mark_writer(request)
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'is_edit': True,
@@ -101,6 +153,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
@@ -108,35 +161,47 @@ def add_comment(request, post_id):
         comment.author = request.user
         comment.post = get_object_or_404(Post, pk=post_id)
         comment.save()
+        feed_cache.mark_writer(request)
     return redirect('posts:post_detail', post_id)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = fulltext.search_page(
+        query, request.GET.get('after'), POSTS_QUANTITY)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@conditional_feed(follow_feeds)
 def follow_index(request):
-    post_list = (Post.objects.filter(author__following__user=request.user))
-    paginator = Paginator(post_list, POSTS_QUANTITY)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, path = timeline.feed_paginator(request.user, POSTS_QUANTITY)
+    page_obj = page_from_request(request, paginator)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/follow.html', context)
+    response = render(request, 'posts/follow.html', context)
+    response['X-Feed-Path'] = path
+    return response
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     following_user = get_object_or_404(User, username=username)
-    if (request.user != following_user and not Follow.objects.filter(
-            user=request.user, author=following_user).exists()):
-        Follow.objects.create(user=request.user, author=following_user)
+    if request.user != following_user:
+        Follow.objects.get_or_create(
+            user=request.user, author=following_user)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    follow_record = Follow.objects.filter(
+    Follow.objects.filter(
         user=request.user,
-        author=get_object_or_404(User, username=username))
-    if follow_record.exists():
-        follow_record.delete()
+        author=get_object_or_404(User, username=username)).delete()
     return redirect('posts:profile', username=username)
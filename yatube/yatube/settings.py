@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,8 +149,70 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads larger than 256 KB are streamed to a temporary file instead of
+# memory; core.uploads drops files over IMAGE_MAX_BYTES while receiving.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.SizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+# Images over this many pixels are rejected from the header alone; larger
+# sides than IMAGE_MAX_SIDE are downscaled before the original is stored.
+IMAGE_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_MAX_SIDE = 2560
+
+# One memory-mapped file shared by all worker processes on the host, so
+# version bumps and invalidations reach every worker. Its values are
+# unpickled, so it lives in a private directory of the project, never in
+# the shared temp directory.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.mmap_cache.MmapCache',
+        'LOCATION': os.path.join(BASE_DIR, 'var', 'cache.mmap'),
+        'OPTIONS': {
+            'SIZE': 64 * 1024 * 1024,
+            'MAX_ENTRIES': 50000,
+        },
     }
 }
+# Threads that pre-generate post thumbnails after upload (posts.thumbnails).
+# With 0 thumbnails are generated in the request that first needs them.
+THUMBNAIL_WORKERS = 2
+# Processes that resize and encode srcset variants (posts.ImageVariant).
+# With 0 this happens in the thumbnail thread itself.
+IMAGE_PROCESSES = 2
+
+# Posts of authors with at least this many followers are pulled into /follow/
+# at read time instead of being pushed to every follower's timeline.
+FEED_CELEBRITY_THRESHOLD = 1000
+
+# Feed pages linked by number in paginator.html; deeper pages are reached
+# with before/after cursors (posts.paginators.CursorPaginator).
+FEED_PAGE_NUMBER_LIMIT = 5
+
+# Per-view SQL budgets checked by core.middleware.QueryBudgetMiddleware:
+# number of queries and total DB time in milliseconds.
+QUERY_BUDGET_DEFAULT = {'queries': 30, 'time': 500}
+QUERY_BUDGETS = {
+    'posts:index': {'queries': 6, 'time': 100},
+    'posts:group_list': {'queries': 7, 'time': 100},
+    'posts:profile': {'queries': 8, 'time': 100},
+    'posts:post_detail': {'queries': 7, 'time': 100},
+    'posts:follow_index': {'queries': 12, 'time': 150},
+    'posts:search': {'queries': 5, 'time': 100},
+    'posts:api_index': {'queries': 3, 'time': 50},
+    'posts:api_group_list': {'queries': 5, 'time': 50},
+    'posts:api_profile': {'queries': 5, 'time': 50},
+    'posts:api_post_detail': {'queries': 5, 'time': 50},
+    'posts:api_follow_index': {'queries': 10, 'time': 100},
+    'posts:post_create': {'queries': 23, 'time': 150},
+    'posts:post_edit': {'queries': 21, 'time': 150},
+}
+# Raise core.middleware.QueryBudgetExceeded when the query count is over
+# budget; an exceeded time budget is always only logged.
+# Tests always run strict (see core.testing.TEST_SETTINGS).
+QUERY_BUDGET_STRICT = False
+
+TEST_RUNNER = 'core.testing.TestRunner'